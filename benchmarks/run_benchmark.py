@@ -0,0 +1,185 @@
+"""
+Benchmarks each stage of the contract-note pipeline on synthetic encrypted notes.
+
+Usage:
+    python -m benchmarks.run_benchmark --notes 20 --save baseline.json
+    python -m benchmarks.run_benchmark --notes 20 --compare baseline.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from io import BytesIO
+
+from benchmarks.synthetic_notes import make_contract_note
+from constants import CSV_ENCODING
+from process.process_pdf import (
+    unlock_pdf_to_memory, extract_tables_from_pdf, extract_date_components,
+    process_pdfs_to_ledger_with_new_format, generate_ledger_xml,
+)
+from process.speculation import SpeculationTracker
+
+BENCHMARK_PASSWORD = "BENCH01"
+STAGES = ["unlock_pdf", "extract_tables_from_pdf", "process_pdfs_to_ledger_with_new_format",
+          "identify_speculation", "generate_ledger_xml"]
+
+
+class PipelineBenchmark:
+    """
+    Holds the synthetic notes and the intermediate results passed from one stage to the next.
+
+    Each stage method processes the whole batch of notes, so its run time divided by the number of notes
+    gives the per-note cost of that stage.
+    """
+
+    def __init__(self, work_dir, note_paths, trade_dates):
+        self.work_dir = work_dir
+        self.note_paths = note_paths
+        self.trade_dates = trade_dates
+        self.unlocked = []
+        self.extracted = []
+        self.buy_ledger_csv = os.path.join(work_dir, "csv", "buy_ledger.csv")
+        self.sell_ledger_csv = os.path.join(work_dir, "csv", "sell_ledger.csv")
+
+    def unlock_pdf(self):
+        self.unlocked = [unlock_pdf_to_memory(path, BENCHMARK_PASSWORD).getvalue() for path in self.note_paths]
+
+    def extract_tables_from_pdf(self):
+        self.extracted = [extract_tables_from_pdf(BytesIO(pdf_bytes)) for pdf_bytes in self.unlocked]
+
+    def process_pdfs_to_ledger_with_new_format(self):
+        for ledger_csv in (self.buy_ledger_csv, self.sell_ledger_csv):
+            if os.path.exists(ledger_csv):
+                os.remove(ledger_csv)
+        for trades, trade_date in self.extracted:
+            process_pdfs_to_ledger_with_new_format(trades, self.buy_ledger_csv, self.sell_ledger_csv,
+                                                   extract_date_components(trade_date))
+
+    def identify_speculation(self):
+        tracker = SpeculationTracker()
+        for trades, trade_date in self.extracted:
+            tracker.add_trades(trade_date, trades)
+        tracker.print_report()
+
+    def generate_ledger_xml(self):
+        generate_ledger_xml(self.buy_ledger_csv)
+
+
+def time_stage(stage, repeat):
+    """Returns the best wall time of repeat runs and the peak traced memory of one extra run."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    stage()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak_memory
+
+
+def run_benchmark(notes, trade_pages, filler_pages, rows_per_table, security_count, repeat):
+    """
+    Generates synthetic notes in a temporary folder and times every pipeline stage on them.
+
+    Returns:
+        dict: The configuration, per-stage seconds, throughput and peak memory, and the process peak RSS.
+    """
+    config = {"notes": notes, "trade_pages": trade_pages, "filler_pages": filler_pages,
+              "rows_per_table": rows_per_table, "security_count": security_count, "repeat": repeat}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for folder in ("docs", "csv", "ledger_files"):
+            os.makedirs(os.path.join(work_dir, folder))
+
+        note_paths, trade_dates = [], []
+        total_rows = 0
+        first_day = date(2024, 4, 1)
+        for idx in range(notes):
+            trade_date = (first_day + timedelta(days=idx)).strftime("%d-%b-%Y")
+            note_path = os.path.join(work_dir, "docs", f"note_{idx:05d}.pdf")
+            total_rows += make_contract_note(note_path, BENCHMARK_PASSWORD, trade_date, trade_pages, filler_pages,
+                                             rows_per_table, security_count, seed=idx)
+            note_paths.append(note_path)
+            trade_dates.append(trade_date)
+
+        benchmark = PipelineBenchmark(work_dir, note_paths, trade_dates)
+        stages = {}
+        cwd = os.getcwd()
+        # generate_ledger_xml writes to the relative CREATE_LEDGER_XML path
+        os.chdir(work_dir)
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                for stage in STAGES:
+                    seconds, peak_memory = time_stage(getattr(benchmark, stage), repeat)
+                    stages[stage] = {
+                        "seconds": seconds,
+                        "notes_per_sec": notes / seconds if seconds else None,
+                        "rows_per_sec": total_rows / seconds if seconds else None,
+                        "peak_traced_memory_bytes": peak_memory,
+                    }
+        finally:
+            os.chdir(cwd)
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+
+    return {"config": config, "total_rows": total_rows, "stages": stages, "peak_rss_bytes": peak_rss}
+
+
+def print_report(results, baseline=None):
+    print(f"{results['config']['notes']} notes, {results['total_rows']} trade rows")
+    print(f"{'stage':<42}{'seconds':>10}{'notes/s':>12}{'rows/s':>12}{'peak MiB':>10}{'vs base':>10}")
+    for stage, metrics in results["stages"].items():
+        change = ""
+        if baseline and stage in baseline["stages"]:
+            base_seconds = baseline["stages"][stage]["seconds"]
+            change = f"{(metrics['seconds'] - base_seconds) / base_seconds:+.1%}" if base_seconds else ""
+        print(f"{stage:<42}{metrics['seconds']:>10.3f}{metrics['notes_per_sec'] or 0:>12.1f}"
+              f"{metrics['rows_per_sec'] or 0:>12.0f}{metrics['peak_traced_memory_bytes'] / 2 ** 20:>10.1f}"
+              f"{change:>10}")
+    print(f"Peak RSS: {results['peak_rss_bytes'] / 2 ** 20:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the contract-note pipeline on synthetic notes.")
+    parser.add_argument("--notes", type=int, default=10, help="number of contract notes to generate")
+    parser.add_argument("--trade-pages", type=int, default=2, help="pages with a trade table per note")
+    parser.add_argument("--filler-pages", type=int, default=6, help="annexure pages without trades per note")
+    parser.add_argument("--rows", type=int, default=20, help="trade rows per table")
+    parser.add_argument("--securities", type=int, default=50, help="distinct securities traded")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per stage; the best one is reported")
+    parser.add_argument("--save", help="write the results to this JSON file as a baseline")
+    parser.add_argument("--compare", help="compare the results against a baseline JSON file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.notes, args.trade_pages, args.filler_pages, args.rows, args.securities,
+                            args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding=CSV_ENCODING) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["config"] != results["config"]:
+            print(f"Warning: baseline was recorded with a different configuration: {baseline['config']}")
+
+    print_report(results, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding=CSV_ENCODING) as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"Baseline saved to: {args.save}")
+
+
+if __name__ == "__main__":
+    main()
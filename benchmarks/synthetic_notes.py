@@ -0,0 +1,162 @@
+import random
+
+import pikepdf
+
+PAGE_WIDTH = 842
+PAGE_HEIGHT = 595
+MARGIN = 30
+FONT_SIZE = 6
+LINE_HEIGHT = 8
+ROW_HEIGHT = 12
+
+# Header cells of an HDFC Securities trade table, split into the lines they are printed on
+TRADE_TABLE_HEADER = [
+    ["Segment"],
+    ["Security description"],
+    ["Quantity", "Bought for you"],
+    ["Quantity Sold", "for you"],
+    ["Total gross", "(Rs.)"],
+    ["Average rate", "(Rs.)"],
+    ["Brokerage", "(Total)"],
+    ["**GST on", "Brokerage (Rs.)"],
+    ["Total Security", "Transaction", "Tax(Rs.)"],
+    ["Other", "Statutory", "*Levies(Rs.)"],
+    ["Net Amount", "(Rs.)"],
+]
+COLUMN_WIDTHS = [50, 190] + [60] * 9
+HEADER_HEIGHT = LINE_HEIGHT * max(len(cell) for cell in TRADE_TABLE_HEADER) + 4
+TABLE_TOP = PAGE_HEIGHT - MARGIN - 20
+
+# Rows that fit under the header on one page, leaving room for the Sub Total row
+MAX_ROWS_PER_TABLE = (TABLE_TOP - MARGIN - HEADER_HEIGHT) // ROW_HEIGHT - 1
+
+FILLER_TEXT = [
+    "Annexure: description of service tax and statutory levies charged on this contract note.",
+    "This contract note is issued subject to the rules, bye-laws and regulations of the exchange.",
+    "Please verify the transactions and report any discrepancy within 24 hours of receipt.",
+]
+
+
+def pdf_string(text):
+    escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"({escaped})"
+
+
+def text_ops(x, y, text):
+    return f"BT /F1 {FONT_SIZE} Tf {x} {y} Td {pdf_string(text)} Tj ET\n"
+
+
+def line_ops(x1, y1, x2, y2):
+    return f"{x1} {y1} m {x2} {y2} l S\n"
+
+
+def trade_rows(rng, count, security_count):
+    """Returns count random trade rows, each a list of 11 cell strings."""
+    rows = []
+    for row_idx in range(count):
+        security = rng.randrange(security_count)
+        quantity = rng.randrange(1, 100) * 10
+        rate = round(rng.uniform(10, 5000), 2)
+        gross = round(quantity * rate, 2)
+        brokerage = round(gross * 0.001, 2)
+        bought = rng.random() < 0.5
+        rows.append([
+            "Equity" if row_idx == 0 else "",
+            f"SYNTHETIC SECURITY {security:04d} LTD-MTF-INE{security:06d}01",
+            str(quantity) if bought else "0",
+            "0" if bought else str(quantity),
+            f"{gross:.2f}",
+            f"{rate:.2f}",
+            f"{brokerage:.2f}",
+            f"{brokerage * 0.18:.2f}",
+            f"{gross * 0.001:.2f}",
+            f"{gross * 0.0001:.2f}",
+            f"{gross + brokerage:.2f}",
+        ])
+    return rows
+
+
+def trade_page_content(trade_date, rows):
+    """Draws the Trade Date header and a ruled trade table with a Sub Total row."""
+    content = text_ops(MARGIN, PAGE_HEIGHT - MARGIN, f"Trade Date {trade_date}")
+
+    row_heights = [HEADER_HEIGHT] + [ROW_HEIGHT] * (len(rows) + 1)
+    table_bottom = TABLE_TOP - sum(row_heights)
+    column_edges = [MARGIN]
+    for width in COLUMN_WIDTHS:
+        column_edges.append(column_edges[-1] + width)
+
+    # Horizontal and vertical rules, so pdfplumber's default "lines" strategy finds the cells
+    y = TABLE_TOP
+    content += line_ops(column_edges[0], y, column_edges[-1], y)
+    for height in row_heights:
+        y -= height
+        content += line_ops(column_edges[0], y, column_edges[-1], y)
+    for x in column_edges:
+        content += line_ops(x, TABLE_TOP, x, table_bottom)
+
+    y = TABLE_TOP
+    for col_idx, cell_lines in enumerate(TRADE_TABLE_HEADER):
+        for line_idx, line in enumerate(cell_lines):
+            content += text_ops(column_edges[col_idx] + 2, y - LINE_HEIGHT * (line_idx + 1), line)
+    y -= HEADER_HEIGHT
+
+    sub_total = ["", "Sub Total"] + [""] * (len(TRADE_TABLE_HEADER) - 2)
+    for row in rows + [sub_total]:
+        for col_idx, cell in enumerate(row):
+            if cell:
+                content += text_ops(column_edges[col_idx] + 2, y - ROW_HEIGHT + 3, cell)
+        y -= ROW_HEIGHT
+    return content
+
+
+def filler_page_content(trade_date, rng):
+    content = text_ops(MARGIN, PAGE_HEIGHT - MARGIN, f"Trade Date {trade_date}")
+    y = TABLE_TOP
+    while y > MARGIN:
+        content += text_ops(MARGIN, y, rng.choice(FILLER_TEXT))
+        y -= LINE_HEIGHT
+    return content
+
+
+def make_contract_note(path, password, trade_date, trade_pages=2, filler_pages=6, rows_per_table=20,
+                       security_count=50, seed=0):
+    """
+    Writes a synthetic password-protected contract note in the HDFC Securities layout.
+
+    The note has filler_pages annexure pages followed by trade_pages pages with one 11-column Segment table each.
+    Every page carries the "Trade Date DD-Mon-YYYY" header.
+
+    Parameters:
+        path (str): Where to write the encrypted PDF.
+        password (str): User and owner password of the PDF.
+        trade_date (str): Trade date in 'DD-Mon-YYYY' format.
+        trade_pages (int): Number of pages with a trade table.
+        filler_pages (int): Number of annexure pages without trade tables.
+        rows_per_table (int): Number of trade rows in each table.
+        security_count (int): Number of distinct securities the rows are drawn from.
+        seed (int): Seed for the random trade values.
+
+    Returns:
+        int: Total number of trade rows written.
+    """
+    if rows_per_table > MAX_ROWS_PER_TABLE:
+        raise ValueError(f"At most {MAX_ROWS_PER_TABLE} rows fit in one table, got {rows_per_table}.")
+
+    rng = random.Random(seed)
+    pdf = pikepdf.new()
+    font = pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1,
+                              BaseFont=pikepdf.Name.Helvetica)
+
+    pages = [filler_page_content(trade_date, rng) for _ in range(filler_pages)]
+    pages += [trade_page_content(trade_date, trade_rows(rng, rows_per_table, security_count))
+              for _ in range(trade_pages)]
+
+    for content in pages:
+        page = pdf.add_blank_page(page_size=(PAGE_WIDTH, PAGE_HEIGHT))
+        page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+        page.Contents = pdf.make_stream(content.encode("latin-1"))
+
+    pdf.save(path, encryption=pikepdf.Encryption(user=password, owner=password))
+    pdf.close()
+    return trade_pages * rows_per_table
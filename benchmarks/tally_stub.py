@@ -0,0 +1,150 @@
+"""
+A stand-in for Tally's XML-over-HTTP port, to exercise and time the import client without a Tally installation.
+
+Every POST is answered with an import response counting each TALLYMESSAGE as created. Optional latency and
+failures imitate a busy or flaky server.
+
+Usage:
+    python -m benchmarks.tally_stub --port 9000 --latency 0.05 --fail-every 10
+    python -m benchmarks.tally_stub --benchmark --messages 20000
+"""
+import argparse
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from constants import CSV_ENCODING, XML_TALLYMESSAGE
+
+MESSAGE_REGEX = re.compile(f"<{XML_TALLYMESSAGE}[ >]")
+RESPONSE_TEMPLATE = ("<RESPONSE><CREATED>{created}</CREATED><ALTERED>0</ALTERED><DELETED>0</DELETED>"
+                     "<LASTVCHID>0</LASTVCHID><LASTMID>0</LASTMID><COMBINED>0</COMBINED><IGNORED>0</IGNORED>"
+                     "<ERRORS>0</ERRORS><CANCELLED>0</CANCELLED></RESPONSE>")
+
+
+class TallyStubServer(ThreadingHTTPServer):
+    """
+    Counts the requests, connections and messages it receives.
+
+    Parameters:
+        port (int): Port to listen on, 0 for any free port.
+        latency (float): Seconds every request takes to answer.
+        fail_every (int): Answer every n-th request with HTTP 503 instead of importing it. 0 never fails.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, fail_every=0):
+        super().__init__(("127.0.0.1", port), TallyStubHandler)
+        self.latency = latency
+        self.fail_every = fail_every
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.created = 0
+        self.failed = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        """Serves from a background thread and returns the server."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class TallyStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this each keep-alive response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode(CSV_ENCODING)
+        with self.server.lock:
+            self.server.requests += 1
+            fail = self.server.fail_every and self.server.requests % self.server.fail_every == 0
+        time.sleep(self.server.latency)
+
+        if fail:
+            with self.server.lock:
+                self.server.failed += 1
+            self.send_error(503, "Tally is busy")
+            return
+
+        created = len(MESSAGE_REGEX.findall(body))
+        with self.server.lock:
+            self.server.created += created
+        response = RESPONSE_TEMPLATE.format(created=created).encode(CSV_ENCODING)
+        self.send_response(200)
+        self.send_header("Content-Type", f"text/xml; charset={CSV_ENCODING}")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def synthetic_messages(count):
+    """Yields count ledger creation messages with distinct names."""
+    from process.tally_xml import group_message, ledger_message
+
+    yield group_message(4)
+    for index in range(count - 1):
+        yield ledger_message(f"SYNTHETIC SECURITY {index:06d} SHARES", "1000.0", "Quantity: 10, Rate: 100.0", 4)
+
+
+def run_benchmark(messages, latency, fail_every, batch_sizes, connection_counts):
+    """Imports the same synthetic messages into a fresh stub server with every batch size and connection count."""
+    from process.tally_client import TallyClient
+
+    print(f"{'batch':>6} {'conns':>6} {'seconds':>9} {'requests':>9} {'connects':>9} {'created':>8} {'failed':>7}")
+    for batch_size in batch_sizes:
+        for connections in connection_counts:
+            server = TallyStubServer(latency=latency, fail_every=fail_every).start()
+            start = time.perf_counter()
+            with TallyClient(server.url, connections, backoff=0.01) as client:
+                result = client.import_messages(synthetic_messages(messages), batch_size)
+            seconds = time.perf_counter() - start
+            server.shutdown()
+            server.server_close()
+            print(f"{batch_size:>6} {connections:>6} {seconds:>9.2f} {server.requests:>9} {server.connections:>9} "
+                  f"{result.counts['CREATED']:>8} {result.failed_batches + result.unanswered_batches:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a stub Tally import server, or benchmark the import client "
+                                                 "against one.")
+    parser.add_argument("--port", type=int, default=9000, help="port to serve on")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every request takes")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every n-th request with HTTP 503")
+    parser.add_argument("--benchmark", action="store_true", help="time the import client instead of serving")
+    parser.add_argument("--messages", type=int, default=10000, help="messages imported per benchmark run")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 500])
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.messages, args.latency, args.fail_every, args.batch_sizes, args.connections)
+        return
+
+    server = TallyStubServer(args.port, args.latency, args.fail_every)
+    print(f"Stub Tally server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Requests: {server.requests}, connections: {server.connections}, created: {server.created}, "
+              f"failed: {server.failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,36 @@ CSV_FOLDER_PATH = "./csv"
 DOCS_FOLDER_PATH = "./docs"
 COMPLETED_FOLDER_PATH = "./completed"
 LEDGER_FOLDER_PATH = "./ledger_files"
+CACHE_FOLDER_PATH = "./cache"
+ACCOUNTS_FOLDER_PATH = "./accounts"
+ACCOUNTS_CONFIG_JSON = "./accounts.json"
 BOUGHT_STOCKS_CSV = f"{CSV_FOLDER_PATH}/bought_stocks.csv"
 SOLD_STOCKS_CSV = f"{CSV_FOLDER_PATH}/sold_stocks.csv"
 PROFIT_LOSS_CSV = f"{CSV_FOLDER_PATH}/profit_loss.csv"
 BUY_LEDGER_CSV = f"{CSV_FOLDER_PATH}/buy_ledger.csv"
 SELL_LEDGER_CSV = f"{CSV_FOLDER_PATH}/sell_ledger.csv"
+LEDGER_MANIFEST_JSON = f"{CSV_FOLDER_PATH}/ledger_manifest.json"
+LEDGER_STORE_PATH = f"{CSV_FOLDER_PATH}/ledger_store"
+PNL_BOOK_PATH = f"{CSV_FOLDER_PATH}/pnl_book.sqlite"
+SECURITY_MASTER_PATH = f"{CSV_FOLDER_PATH}/security_master.sqlite"
+PASSWORD_CACHE_JSON = f"{CACHE_FOLDER_PATH}/password_cache.json"
 CREATE_LEDGER_XML = f"{LEDGER_FOLDER_PATH}/create_ledger.xml"
+EXTRACTION_CACHE_PATH = f"{CACHE_FOLDER_PATH}/extraction_cache.sqlite"
 DEFAULT_PDF_PASS = "DEE0702"
 
+# Number of worker processes used to extract contract notes (1 = serial)
+DEFAULT_WORKERS = 1
+
+# Seconds between scans of the docs folder in --watch mode
+WATCH_POLL_INTERVAL = 0.2
+
+# Number of functions listed when profiling a single note
+PROFILE_TOP_FUNCTIONS = 25
+
+# Extraction cache settings. Bump PARSER_VERSION whenever table extraction changes so stale entries are ignored.
+PARSER_VERSION = "6"
+EXTRACTION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
 # Temporary unlocked PDF file name
 TEMP_UNLOCKED_PDF = "unlocked.pdf"
 PDF_EXT = ".pdf"
@@ -18,8 +40,13 @@ CSV_EXT = '.csv'
 
 # Column names
 SEGMENT_COLUMN = "Segment"
+TRADE_DATE_MARKER = "Trade Date"
+TRADE_DATE_FORMAT = "%d-%b-%Y"
 NUM_COLUMNS = 11
 
+# Points kept above a trade table header when a page is cropped to the table region
+TABLE_CROP_PADDING = 10
+
 # Regex patterns
 PARENTHESES_PATTERN = r'\(([\d.,]+)\)'
 
@@ -45,21 +72,46 @@ LEDGER_NARRATION = "Narration"
 NARRATION_QUANTITY = "Quantity"
 NARRATION_RATE = "Rate"
 
+# Extra typed columns kept in the columnar ledger store
+LEDGER_QUANTITY = "Quantity"
+LEDGER_RATE = "Rate"
+LEDGER_NOTE = "Note"
+
+# Ledger sides
+LEDGER_SIDE_BUY = "buy"
+LEDGER_SIDE_SELL = "sell"
+LEDGER_SIDES = [LEDGER_SIDE_BUY, LEDGER_SIDE_SELL]
+
 LEDGER_COLUMNS = [LEDGER_DATE, LEDGER_VOUCHER_TYPE, LEDGER_DAY, LEDGER_MONTH, LEDGER_REF_NO, LEDGER_DR_LEDGER,
                   LEDGER_CR_LEDGER, LEDGER_AMOUNT, LEDGER_NARRATION]
 
+# Realized profit and loss
+PNL_TYPE_INTRADAY = "Intraday"
+PNL_TYPE_DELIVERY = "Delivery"
+PNL_COLUMNS = ["Security", "Type", "Buy Date", "Sell Date", "Quantity", "Buy Rate", "Sell Rate", "Buy Value",
+               "Sell Value", "Profit/Loss", "Holding Days", "Note"]
+STOCK_TRADE_COLUMNS = ["Date", "Security", "Quantity", "Rate", "Amount", "Note"]
+
 # Column Names (used in the DataFrame)
 COLUMN_QUANTITY_BOUGHT = "Quantity Bought for you"
 COLUMN_QUANTITY_SOLD = "Quantity Sold for you"
 COLUMN_TOTAL_GROSS = "Total gross (Rs.)"
 COLUMN_AVERAGE_RATE = "Average rate (Rs.)"
 COLUMN_SECURITY_DESC = "Security description"
+COLUMN_BROKERAGE = "Brokerage (Total)"
+COLUMN_GST = "**GST on Brokerage (Rs.)"
+COLUMN_STT = "Total Security Transaction Tax(Rs.)"
+COLUMN_OTHER_LEVIES = "Other Statutory *Levies(Rs.)"
+COLUMN_NET_AMOUNT = "Net Amount (Rs.)"
 
 # Ledger Defaults
 VOUCHER_TYPE = "Journal"
 SHARES_LABEL = "SHARES"
 BROKER_NAME = "HDFC Securities Limited"
 
+# XML writer settings
+XML_INDENT = "  "
+
 # XML Element Constants
 XML_ENVELOPE = "ENVELOPE"
 XML_HEADER = "HEADER"
@@ -85,6 +137,19 @@ TALLY_GROUP_PARENT = "Current Assets"
 REPORT_NAME_ALL_MASTERS = "All Masters"
 TALLY_UDF_NAMESPACE = "TallyUDF"
 
+# Tally XML-over-HTTP import
+TALLY_URL = "http://localhost:9000"
+# TALLYMESSAGEs posted per request
+TALLY_BATCH_SIZE = 100
+# Requests in flight at once, each on its own keep-alive connection
+TALLY_CONNECTIONS = 4
+# Attempts after the first for a batch that got no import response
+TALLY_RETRIES = 3
+# Seconds before the first retry of a batch, doubled for every further retry
+TALLY_RETRY_BACKOFF = 0.5
+# Seconds to wait for Tally to answer one batch
+TALLY_TIMEOUT = 120
+
 # CSV Column Headers
 CSV_COLUMN_DR_LEDGER = "Dr. Ledger"
 CSV_COLUMN_AMOUNT = "Amount"
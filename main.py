@@ -1,34 +1,259 @@
 # main.py
 from constants import (
     DOCS_FOLDER_PATH,
-    COMPLETED_FOLDER_PATH,
     DEFAULT_PDF_PASS,
-    BOUGHT_STOCKS_CSV,
-    SOLD_STOCKS_CSV,
+    DEFAULT_WORKERS,
+    EXTRACTION_CACHE_PATH,
     PROFIT_LOSS_CSV,
     BUY_LEDGER_CSV,
-    SELL_LEDGER_CSV
+    SELL_LEDGER_CSV,
+    LEDGER_MANIFEST_JSON,
+    PNL_BOOK_PATH,
+    SECURITY_MASTER_PATH,
+    CREATE_LEDGER_XML,
+    PDF_EXT,
+    CSV_ENCODING,
+    ACCOUNTS_CONFIG_JSON,
+    TALLY_URL,
+    TALLY_BATCH_SIZE,
+    TALLY_CONNECTIONS,
+    TALLY_RETRIES
 )
 
-from process.process_pdf import process_folder
+# The process modules, and the pandas/pdfplumber/pikepdf/pyarrow imports behind them, are loaded inside each
+# command so a run only pays for the libraries it actually uses.
+import argparse
 import os
+import sys
 
+COMMANDS = ["extract", "ledger", "accounts", "xml", "import", "speculation", "status"]
+DEFAULT_COMMAND = "ledger"
 
-def main():
-    # Clear existing CSV files to start fresh
-    if os.path.exists(BOUGHT_STOCKS_CSV):
-        os.remove(BOUGHT_STOCKS_CSV)
-    if os.path.exists(SOLD_STOCKS_CSV):
-        os.remove(SOLD_STOCKS_CSV)
-    if os.path.exists(PROFIT_LOSS_CSV):
-        os.remove(PROFIT_LOSS_CSV)
-    if os.path.exists(BUY_LEDGER_CSV):
-        os.remove(BUY_LEDGER_CSV)
-    if os.path.exists(SELL_LEDGER_CSV):
-        os.remove(SELL_LEDGER_CSV)
-
-    # Process each file in the folder
-    process_folder(DOCS_FOLDER_PATH, COMPLETED_FOLDER_PATH, DEFAULT_PDF_PASS)
+
+def run_extract(args):
+    """Extracts the notes waiting in the docs folder into the extraction cache, without writing any ledgers."""
+    from process.pipeline import open_cache
+    from process.process_pdf import extract_notes, list_notes
+
+    file_paths = list_notes(DOCS_FOLDER_PATH)
+    if not file_paths:
+        print(f"No contract notes in {DOCS_FOLDER_PATH}")
+        return
+
+    with open_cache(args.no_cache) as cache:
+        for file_path, extracted, _ in extract_notes(file_paths, DEFAULT_PDF_PASS, args.workers, cache):
+            if extracted is None:
+                print(f"Failed to unlock PDF: {file_path}")
+            else:
+                trades, trade_date = extracted
+                print(f"Extracted {len(trades)} trades dated {trade_date} from {file_path}")
+
+
+def run_ledger(args):
+    """Writes the ledgers, P&L and Tally XML for the notes in the docs folder, or keeps watching it."""
+    if args.profile:
+        from process.process_pdf import profile_note
+
+        profile_note(args.profile, DEFAULT_PDF_PASS, args.profile_output)
+        return
+
+    from process.pipeline import run_pipeline
+
+    run_pipeline(DEFAULT_PDF_PASS, args.workers, args.no_cache, args.incremental, args.watch, args.no_parquet,
+                 args.metrics)
+
+
+def run_accounts(args):
+    """Runs the ledger pipeline for every account in the accounts configuration, each in its own folder."""
+    from process.accounts import process_accounts
+
+    process_accounts(args.config, args.workers, args.no_cache, args.incremental, args.no_parquet)
+
+
+def run_xml(args):
+    """Regenerates the Tally import XML from the existing buy ledger CSV."""
+    from process.process_pdf import generate_ledger_xml
+
+    if not os.path.exists(BUY_LEDGER_CSV):
+        print(f"No buy ledger found at {BUY_LEDGER_CSV}")
+        return
+    generate_ledger_xml(BUY_LEDGER_CSV)
+
+
+def run_import(args):
+    """Posts the ledgers of the buy ledger CSV, or the messages of an import file, to Tally over HTTP in batches."""
+    from process.tally_client import import_ledger_csv, import_xml_file
+
+    options = {"url": args.url, "batch_size": args.batch_size, "connections": args.connections,
+               "retries": args.retries, "retry_unanswered": args.retry_unanswered}
+    if args.xml:
+        if not os.path.exists(args.xml):
+            print(f"No import file found at {args.xml}")
+            return
+        import_xml_file(args.xml, **options)
+        return
+
+    if not os.path.exists(BUY_LEDGER_CSV):
+        print(f"No buy ledger found at {BUY_LEDGER_CSV}")
+        return
+    import_ledger_csv(BUY_LEDGER_CSV, **options)
+
+
+def run_speculation(args):
+    """Reports intraday speculation across the notes in the docs folder, without writing any ledgers."""
+    from process.process_pdf import extract_notes, list_notes
+    from process.pipeline import open_cache
+    from process.speculation import SpeculationTracker
+
+    file_paths = list_notes(DOCS_FOLDER_PATH)
+    if not file_paths:
+        print(f"No contract notes in {DOCS_FOLDER_PATH}")
+        return
+
+    tracker = SpeculationTracker()
+    with open_cache(args.no_cache) as cache:
+        for file_path, extracted, _ in extract_notes(file_paths, DEFAULT_PDF_PASS, args.workers, cache):
+            if extracted is None:
+                print(f"Failed to unlock PDF: {file_path}")
+            else:
+                tracker.add_trades(extracted[1], extracted[0])
+    tracker.print_report()
+
+
+def count_rows(db_path, query):
+    """Runs a COUNT query against a SQLite file, returning None if the file does not exist."""
+    if not os.path.exists(db_path):
+        return None
+
+    import sqlite3
+
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute(query).fetchone()[0]
+    except sqlite3.Error:
+        return None
+    finally:
+        connection.close()
+
+
+def run_status(args):
+    """Prints pending notes and the state of the ledgers, manifest, P&L book and caches. Uses the stdlib only."""
+    pending = len([name for name in os.listdir(DOCS_FOLDER_PATH) if name.lower().endswith(PDF_EXT)]) \
+        if os.path.isdir(DOCS_FOLDER_PATH) else 0
+    print(f"Pending notes in {DOCS_FOLDER_PATH}: {pending}")
+
+    for path in (BUY_LEDGER_CSV, SELL_LEDGER_CSV, PROFIT_LOSS_CSV, CREATE_LEDGER_XML):
+        if os.path.exists(path):
+            print(f"{path}: {os.path.getsize(path)} bytes")
+        else:
+            print(f"{path}: missing")
+
+    if os.path.exists(LEDGER_MANIFEST_JSON):
+        import json
+
+        with open(LEDGER_MANIFEST_JSON, encoding=CSV_ENCODING) as manifest_file:
+            print(f"Notes in ledger manifest: {len(json.load(manifest_file)['notes'])}")
+
+    booked_notes = count_rows(PNL_BOOK_PATH, "SELECT COUNT(*) FROM notes")
+    if booked_notes is not None:
+        open_lots = count_rows(PNL_BOOK_PATH, "SELECT COUNT(*) FROM lots")
+        print(f"Notes booked for P&L: {booked_notes}, open lots: {open_lots}")
+
+    securities = count_rows(SECURITY_MASTER_PATH, "SELECT COUNT(DISTINCT ledger_name) FROM descriptions")
+    if securities is not None:
+        print(f"Securities in security master: {securities}")
+
+    cached = count_rows(EXTRACTION_CACHE_PATH, "SELECT COUNT(*) FROM extractions")
+    if cached is not None:
+        print(f"Cached extractions: {cached}")
+
+
+def add_extract_arguments(parser):
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of processes used to extract contract notes in parallel")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="re-extract every contract note instead of reusing cached results")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Convert contract notes into buy/sell ledgers.",
+        epilog=f"Without a command, '{DEFAULT_COMMAND}' is run, so the options of '{DEFAULT_COMMAND}' can be "
+               "given directly."
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    extract_parser = commands.add_parser("extract", help="extract the notes in the docs folder into the cache")
+    add_extract_arguments(extract_parser)
+    extract_parser.set_defaults(run=run_extract)
+
+    ledger_parser = commands.add_parser("ledger", help="write ledgers, P&L and Tally XML for the notes (default)")
+    add_extract_arguments(ledger_parser)
+    ledger_parser.add_argument("--incremental", action="store_true",
+                               help="keep the existing ledgers and append only notes that were not processed "
+                                    "before")
+    ledger_parser.add_argument("--watch", action="store_true",
+                               help="keep running and process contract notes as they arrive in the docs folder "
+                                    "(implies --incremental)")
+    ledger_parser.add_argument("--no-parquet", action="store_true",
+                               help="do not write the Parquet ledger store next to the ledger CSVs")
+    ledger_parser.add_argument("--metrics", metavar="JSONL",
+                               help="append per-note stage timings and counters to this JSON lines file")
+    ledger_parser.add_argument("--profile", metavar="PDF",
+                               help="profile extraction of a single contract note with cProfile and exit")
+    ledger_parser.add_argument("--profile-output", metavar="FILE",
+                               help="save the raw --profile statistics to this file")
+    ledger_parser.set_defaults(run=run_ledger)
+
+    accounts_parser = commands.add_parser("accounts", help="write ledgers for several accounts, each with its "
+                                                           "own passwords and output folder")
+    accounts_parser.add_argument("--config", default=ACCOUNTS_CONFIG_JSON,
+                                 help="JSON file mapping each account to its passwords, plus fallback passwords")
+    accounts_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                                 help="number of accounts processed concurrently")
+    accounts_parser.add_argument("--no-cache", action="store_true",
+                                 help="re-extract every contract note instead of reusing cached results")
+    accounts_parser.add_argument("--incremental", action="store_true",
+                                 help="keep each account's existing ledgers and append only new notes")
+    accounts_parser.add_argument("--no-parquet", action="store_true",
+                                 help="do not write the Parquet ledger stores")
+    accounts_parser.set_defaults(run=run_accounts)
+
+    xml_parser = commands.add_parser("xml", help="regenerate the Tally XML from the buy ledger CSV")
+    xml_parser.set_defaults(run=run_xml)
+
+    import_parser = commands.add_parser("import", help="post the ledgers to Tally over HTTP in batches")
+    import_parser.add_argument("--url", default=TALLY_URL, help="address of Tally's XML-over-HTTP port")
+    import_parser.add_argument("--xml", metavar="FILE",
+                               help="post the messages of this import file instead of the buy ledger's ledgers")
+    import_parser.add_argument("--batch-size", type=int, default=TALLY_BATCH_SIZE,
+                               help="number of TALLYMESSAGEs posted per request")
+    import_parser.add_argument("--connections", type=int, default=TALLY_CONNECTIONS,
+                               help="number of requests in flight at once")
+    import_parser.add_argument("--retries", type=int, default=TALLY_RETRIES,
+                               help="times a batch Tally turned away or never received is posted again")
+    import_parser.add_argument("--retry-unanswered", action="store_true",
+                               help="also post again batches that were sent but got no response, which may "
+                                    "duplicate vouchers Tally had already imported")
+    import_parser.set_defaults(run=run_import)
+
+    speculation_parser = commands.add_parser("speculation", help="report intraday trades in the pending notes")
+    add_extract_arguments(speculation_parser)
+    speculation_parser.set_defaults(run=run_speculation)
+
+    status_parser = commands.add_parser("status", help="show pending notes and the state of the outputs")
+    status_parser.set_defaults(run=run_status)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Keep `main.py [ledger options]` working for existing cron entries
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv = [DEFAULT_COMMAND] + argv
+
+    args = build_parser().parse_args(argv)
+    args.run(args)
 
 
 if __name__ == "__main__":
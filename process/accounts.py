@@ -0,0 +1,153 @@
+import json
+import os
+import re
+from contextlib import nullcontext
+
+from constants import (
+    ACCOUNTS_FOLDER_PATH, CSV_ENCODING, CSV_FOLDER_PATH, DOCS_FOLDER_PATH, PASSWORD_CACHE_JSON,
+)
+
+DIGITS_REGEX = re.compile(r"\d+")
+
+
+def load_accounts(config_path):
+    """
+    Reads the accounts configuration.
+
+    The file is JSON of the form
+        {"accounts": {"<account>": "<password>" or ["<password>", ...]}, "fallback_passwords": ["<password>", ...]}
+
+    Returns:
+        tuple: ({account: [passwords]}, [fallback passwords])
+    """
+    with open(config_path, encoding=CSV_ENCODING) as config_file:
+        config = json.load(config_file)
+
+    accounts = {}
+    for account, passwords in config.get("accounts", {}).items():
+        accounts[account] = [passwords] if isinstance(passwords, str) else list(passwords)
+    return accounts, list(config.get("fallback_passwords", []))
+
+
+def filename_pattern(filename):
+    """Returns the pattern a note's file name belongs to, with every run of digits replaced by '#'."""
+    return DIGITS_REGEX.sub("#", filename.lower())
+
+
+class PasswordResolver:
+    """
+    Orders an account's candidate passwords for each contract note, the one that opened earlier notes with the
+    same file name pattern first.
+
+    The candidates are tried while the note is unlocked for extraction, so finding the password costs no extra
+    open of the PDF, and notes skipped as duplicates or served from the extraction cache are never opened.
+
+    Only the position of the working candidate is stored, in a JSON file, so the cache never holds a password.
+    If the candidates change, a stale position costs at most one failed attempt before it is learned again.
+
+    Parameters:
+        candidates (list): Passwords to try, in order.
+        cache_path (str): JSON file of the working candidate's position per file name pattern.
+    """
+
+    def __init__(self, candidates, cache_path=PASSWORD_CACHE_JSON):
+        # Keep the first occurrence of each candidate, in order
+        self.candidates = list(dict.fromkeys(candidates))
+        self.cache_path = cache_path
+        self.known = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, encoding=CSV_ENCODING) as cache_file:
+                self.known = json.load(cache_file)
+
+    def ordered_candidates(self, pdf_path):
+        """Returns the candidates to try on pdf_path, the one that opened its file name pattern before first."""
+        known = self.known.get(filename_pattern(os.path.basename(pdf_path)))
+        positions = sorted(range(len(self.candidates)), key=lambda position: position != known)
+        return [self.candidates[position] for position in positions]
+
+    def remember(self, pdf_path, password):
+        """Records that password opened pdf_path, so it is tried first on notes with the same file name pattern."""
+        self.known[filename_pattern(os.path.basename(pdf_path))] = self.candidates.index(password)
+
+    def save(self):
+        cache_folder = os.path.dirname(self.cache_path)
+        if cache_folder and not os.path.exists(cache_folder):
+            os.makedirs(cache_folder)
+
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "w", encoding=CSV_ENCODING) as cache_file:
+            json.dump(self.known, cache_file, indent=2, sort_keys=True)
+        os.replace(temp_path, self.cache_path)
+
+
+def process_account(account, passwords, fallback_passwords, no_cache=False, incremental=False, no_parquet=False,
+                    accounts_folder=ACCOUNTS_FOLDER_PATH):
+    """
+    Runs the ledger pipeline for one account inside its own folder.
+
+    The account folder has the same layout as a single-account run (docs/, csv/, ledger_files/, completed/ and
+    cache/), so the ledgers, manifest, P&L book and caches of different accounts never mix. The process works
+    from the account folder while it runs, which is why accounts run in separate processes when concurrent.
+
+    Parameters:
+        account (str): Name of the account, which is also its folder name.
+        passwords (list): Passwords of the account, tried first.
+        fallback_passwords (list): Passwords tried when none of the account's own passwords open a note.
+        no_cache (bool): Re-extract every note instead of reusing cached results.
+        incremental (bool): Keep the account's existing outputs and add only new notes.
+        no_parquet (bool): Do not write the Parquet ledger store.
+        accounts_folder (str): Folder holding one folder per account.
+
+    Returns:
+        tuple: (account, True if its ledgers were updated)
+    """
+    from process.pipeline import run_pipeline
+
+    cwd = os.getcwd()
+    os.chdir(os.path.join(accounts_folder, account))
+    try:
+        for folder in (DOCS_FOLDER_PATH, CSV_FOLDER_PATH):
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+        # Notes no candidate opens stay in docs/ and are reported as failed unlocks
+        resolver = PasswordResolver(passwords + fallback_passwords)
+        try:
+            return account, run_pipeline(resolver, no_cache=no_cache, incremental=incremental, no_parquet=no_parquet)
+        finally:
+            resolver.save()
+    finally:
+        os.chdir(cwd)
+
+
+def process_accounts(config_path, workers=1, no_cache=False, incremental=False, no_parquet=False,
+                     accounts_folder=ACCOUNTS_FOLDER_PATH):
+    """
+    Processes every account in the configuration, running up to workers accounts at once.
+
+    Parameters:
+        config_path (str): Path to the accounts JSON configuration (see load_accounts).
+        workers (int): Number of accounts processed concurrently, each in its own process.
+
+    The remaining parameters are passed to process_account.
+    """
+    accounts, fallback_passwords = load_accounts(config_path)
+    missing = [account for account in accounts if not os.path.isdir(os.path.join(accounts_folder, account))]
+    for account in missing:
+        print(f"Skipping account {account}: no folder at {os.path.join(accounts_folder, account)}")
+        del accounts[account]
+
+    names = sorted(accounts)
+    args = [(name, accounts[name], fallback_passwords, no_cache, incremental, no_parquet, accounts_folder)
+            for name in names]
+    parallel = workers > 1 and len(names) > 1
+    if parallel:
+        from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) if parallel else nullcontext() as executor:
+        if parallel:
+            results = executor.map(process_account, *zip(*args))
+        else:
+            results = (process_account(*account_args) for account_args in args)
+        for account, updated in results:
+            print(f"Account {account}: {'ledgers updated' if updated else 'nothing new'}")
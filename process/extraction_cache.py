@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from constants import EXTRACTION_CACHE_MAX_BYTES, PARSER_VERSION
+from process.trade_row import TradeRow
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_pdf(pdf_path):
+    """Returns the SHA-256 hex digest of a PDF's raw (still encrypted) content."""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as pdf:
+        for chunk in iter(lambda: pdf.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Persistent cache of extract_tables_from_pdf results (trades and trade date), keyed by PDF content hash and
+    parser version.
+
+    Entries are stored in a SQLite file. When the stored results grow beyond max_bytes the least recently
+    used entries are evicted.
+
+    Parameters:
+        cache_path (str): Path to the SQLite file backing the cache.
+        max_bytes (int): Maximum total size of the cached results.
+        parser_version (str): Version of the extraction logic. Entries from other versions are never returned.
+    """
+
+    def __init__(self, cache_path, max_bytes=EXTRACTION_CACHE_MAX_BYTES, parser_version=PARSER_VERSION):
+        cache_folder = os.path.dirname(cache_path)
+        if cache_folder and not os.path.exists(cache_folder):
+            os.makedirs(cache_folder)
+
+        self.max_bytes = max_bytes
+        self.parser_version = parser_version
+        self.connection = sqlite3.connect(cache_path, timeout=30)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def key_for(self, pdf_path, digest=None):
+        """Returns the cache key for a PDF file, reusing its hash_pdf digest if it was already computed."""
+        return f"{self.parser_version}:{digest or hash_pdf(pdf_path)}"
+
+    def get(self, key):
+        """Returns the cached (trades, trade_date) for key, or None on a miss."""
+        row = self.connection.execute("SELECT value FROM extractions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        self.connection.execute("UPDATE extractions SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.connection.commit()
+        value = json.loads(row[0])
+        return [TradeRow.from_list(trade) for trade in value["trades"]], value["trade_date"]
+
+    def put(self, key, extracted):
+        """Stores the (trades, trade_date) extracted for key and evicts entries over the size limit."""
+        trades, trade_date = extracted
+        value = json.dumps({"trades": [trade.as_list() for trade in trades], "trade_date": trade_date})
+        self.connection.execute(
+            "INSERT OR REPLACE INTO extractions (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, value, len(value), time.time())
+        )
+        self.evict()
+        self.connection.commit()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_bytes."""
+        total_size = 0
+        stale_keys = []
+        for key, size in self.connection.execute("SELECT key, size FROM extractions ORDER BY last_used DESC"):
+            total_size += size
+            if total_size > self.max_bytes:
+                stale_keys.append((key,))
+        self.connection.executemany("DELETE FROM extractions WHERE key = ?", stale_keys)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,181 @@
+import re
+from datetime import datetime
+
+from constants import (
+    BROKER_NAME, EMPTY_STRING, NUM_COLUMNS, SEGMENT_COLUMN, SUB_TOTAL_STRING, TRADE_DATE_FORMAT, TRADE_DATE_MARKER,
+    TABLE_CROP_PADDING,
+)
+from process.trade_row import WHITESPACE_REGEX, normalize_header
+
+
+class LayoutProfile:
+    """
+    How to find and read the trade tables in the contract notes of one broker.
+
+    Regular expressions are compiled once when the profile is created, and the profile is detected once per
+    document, so pages are only matched against the markers of the layout they actually use.
+
+    Parameters:
+        name (str): Short name of the profile.
+        broker_name (str): Broker ledger the trades are credited to in Tally.
+        detect_pattern (str): Regex matched against the extract_text() of page 1 to recognise the broker's notes.
+        header_signature (list): Header cells every trade table has, after whitespace is normalised.
+        num_columns (int): Number of columns of a trade table, or None if it varies.
+        column_map (dict): Broker header labels mapped to the COLUMN_* names the ledgers use.
+        table_marker (str): Text present on every page holding a trade table, checked before table extraction.
+        trade_date_marker (str): Text present on the page holding the trade date.
+        trade_date_pattern (str): Regex whose first group is the trade date.
+        trade_date_format (str): strptime format of the trade date, converted to TRADE_DATE_FORMAT if different.
+        skip_row_markers (list): Cells that mark sub total and similar rows to leave out.
+        crop_bbox (tuple): (x0, top, x1, bottom) as fractions of the page the trade tables lie within.
+        crop_to_header (bool): Also crop away everything above the ruling line over the first table_marker.
+    """
+
+    def __init__(self, name, broker_name, detect_pattern, header_signature, num_columns, column_map,
+                 table_marker, trade_date_marker, trade_date_pattern, trade_date_format=TRADE_DATE_FORMAT,
+                 skip_row_markers=(), crop_bbox=(0, 0, 1, 1), crop_to_header=True):
+        self.name = name
+        self.broker_name = broker_name
+        self.detect_regex = re.compile(detect_pattern)
+        self.header_signature = list(header_signature)
+        self.num_columns = num_columns
+        self.column_map = dict(column_map)
+        self.table_marker = table_marker
+        self.trade_date_marker = trade_date_marker
+        # Pages often place words without a space glyph between them, so markers are matched without whitespace
+        self.compact_table_marker = WHITESPACE_REGEX.sub(EMPTY_STRING, table_marker)
+        self.compact_trade_date_marker = WHITESPACE_REGEX.sub(EMPTY_STRING, trade_date_marker)
+        self.trade_date_regex = re.compile(trade_date_pattern)
+        self.trade_date_format = trade_date_format
+        self.skip_row_markers = list(skip_row_markers)
+        self.crop_bbox = crop_bbox
+        self.crop_to_header = crop_to_header
+
+    def scan_markers(self, page_text):
+        """Returns (has_table_marker, has_trade_date_marker) for the joined characters of a page, ignoring spaces."""
+        compact_text = WHITESPACE_REGEX.sub(EMPTY_STRING, page_text)
+        return self.compact_table_marker in compact_text, self.compact_trade_date_marker in compact_text
+
+    def find_trade_date(self, page_text):
+        """Returns the trade date found in the text of a page in TRADE_DATE_FORMAT, or None."""
+        match = self.trade_date_regex.search(page_text)
+        if not match:
+            return None
+
+        trade_date = match.group(1)
+        if self.trade_date_format != TRADE_DATE_FORMAT:
+            try:
+                trade_date = datetime.strptime(trade_date, self.trade_date_format).strftime(TRADE_DATE_FORMAT)
+            except ValueError:
+                return None
+        return trade_date
+
+    def is_trade_table(self, header):
+        """Returns True if a table header has this profile's column count and signature cells."""
+        if self.num_columns is not None and len(header) != self.num_columns:
+            return False
+        cells = [normalize_header(cell) for cell in header]
+        return all(cell in cells for cell in self.header_signature)
+
+    def trade_rows(self, table):
+        """Returns the table without rows of the wrong width or containing one of the skip_row_markers."""
+        return [row for row in table
+                if (self.num_columns is None or len(row) == self.num_columns)
+                and not any(marker in row for marker in self.skip_row_markers)]
+
+    def table_region(self, page, chars):
+        """
+        Crops a page to the region holding its trade tables, so table extraction only analyses that region.
+
+        Parameters:
+            page: The pdfplumber page.
+            chars (list): The page's characters, as returned by page_characters.
+        """
+        x0, top, x1, bottom = self.crop_bbox
+        bbox = [x0 * page.width, top * page.height, x1 * page.width, bottom * page.height]
+
+        if self.crop_to_header:
+            marker_char = find_compact(chars, self.compact_table_marker)
+            if marker_char is not None:
+                rule_top = rule_above(page, marker_char)
+                # Without a rule above the marker the table's top cannot be told apart from the header text
+                if rule_top is not None:
+                    bbox[1] = max(bbox[1], rule_top - TABLE_CROP_PADDING)
+
+        bbox = (max(bbox[0], page.bbox[0]), max(bbox[1], page.bbox[1]),
+                min(bbox[2], page.bbox[2]), min(bbox[3], page.bbox[3]))
+        if bbox == tuple(page.bbox):
+            return page
+        return page.crop(bbox)
+
+
+HDFC_SECURITIES = LayoutProfile(
+    name="hdfc_securities",
+    broker_name=BROKER_NAME,
+    detect_pattern=re.escape(BROKER_NAME),
+    header_signature=[SEGMENT_COLUMN],
+    num_columns=NUM_COLUMNS,
+    column_map={},
+    table_marker=SEGMENT_COLUMN,
+    trade_date_marker=TRADE_DATE_MARKER,
+    trade_date_pattern=r"Trade Date\s*(\d{1,2}-[a-zA-Z]{3}-\d{4})",
+    skip_row_markers=[SUB_TOTAL_STRING],
+)
+
+# Profiles are tried in order; the first one whose detect_pattern matches page 1 is used
+LAYOUT_PROFILES = [HDFC_SECURITIES]
+DEFAULT_PROFILE = HDFC_SECURITIES
+
+
+def register_profile(profile):
+    """Adds a broker layout, tried before the profiles registered earlier."""
+    LAYOUT_PROFILES.insert(0, profile)
+
+
+def detect_profile(first_page_text):
+    """
+    Returns the profile whose detect_pattern matches the text of page 1, or DEFAULT_PROFILE.
+
+    The text must come from page.extract_text(), which puts back the spaces between words that the joined
+    characters of a page often lack, so multi-word patterns match.
+    """
+    for profile in LAYOUT_PROFILES:
+        if profile.detect_regex.search(first_page_text):
+            return profile
+    return DEFAULT_PROFILE
+
+
+def find_compact(chars, compact_text):
+    """
+    Returns the character a whitespace-free text starts at in the joined characters, ignoring whitespace, or None.
+
+    This finds markers the same way scan_markers does, on pages that place words without space glyphs between them.
+    """
+    letters = []
+    owners = []
+    for char in chars:
+        for letter in char["text"]:
+            if not letter.isspace():
+                letters.append(letter)
+                owners.append(char)
+
+    found_at = EMPTY_STRING.join(letters).find(compact_text)
+    return owners[found_at] if found_at >= 0 else None
+
+
+def rule_above(page, char):
+    """
+    Returns the top of the lowest horizontal line or rect edge above a character that spans it, or None.
+
+    This is the top border of the table cell holding the character, however far below the border the
+    character sits inside a multi-line header.
+    """
+    tops = [edge["top"] for edge in page.horizontal_edges
+            if edge["top"] <= char["top"] and edge["x0"] <= char["x0"] and edge["x1"] >= char["x1"]]
+    return max(tops) if tops else None
+
+
+def page_characters(page):
+    """Returns the characters of a page and their joined text, read without any layout analysis."""
+    chars = page.chars
+    return chars, EMPTY_STRING.join(char["text"] for char in chars)
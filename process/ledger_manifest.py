@@ -0,0 +1,120 @@
+import json
+import os
+
+from constants import CSV_ENCODING
+
+
+def file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def header_length(path):
+    """Returns the size in bytes of the header line of a ledger CSV."""
+    with open(path, "rb") as ledger_file:
+        return len(ledger_file.readline())
+
+
+class LedgerManifest:
+    """
+    Record of the contract notes already written to the buy and sell ledgers.
+
+    For every note (keyed by file name) the manifest stores its content hash, trade date, the number of buy and
+    sell rows it produced and the byte range those rows occupy in each ledger CSV. This lets an incremental run
+    skip notes it has already seen and replace just the rows of a note whose content changed.
+
+    Parameters:
+        manifest_path (str): Path to the JSON manifest file.
+        buy_ledger_csv (str): Path to the buy ledger CSV the manifest describes.
+        sell_ledger_csv (str): Path to the sell ledger CSV the manifest describes.
+    """
+
+    def __init__(self, manifest_path, buy_ledger_csv, sell_ledger_csv):
+        self.manifest_path = manifest_path
+        self.ledgers = {"buy": buy_ledger_csv, "sell": sell_ledger_csv}
+        self.notes = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding=CSV_ENCODING) as manifest_file:
+                self.notes = json.load(manifest_file)["notes"]
+
+    def is_duplicate(self, digest):
+        """Returns True if a note with this content has already been written to the ledgers."""
+        return any(note["hash"] == digest for note in self.notes.values())
+
+    def ledger_sizes(self):
+        """Returns the current size of each ledger CSV, used as the start offsets of the next note's rows."""
+        return {side: file_size(path) for side, path in self.ledgers.items()}
+
+    def remove_note(self, filename):
+        """
+        Removes the rows written for filename from both ledgers and forgets the note.
+
+        Rows of notes written after it move up, so their recorded offsets are shifted accordingly.
+        """
+        note = self.notes.pop(filename, None)
+        if note is None:
+            return
+
+        for side, path in self.ledgers.items():
+            start, length = note[f"{side}_offset"], note[f"{side}_length"]
+            if not length:
+                continue
+
+            with open(path, "rb") as ledger_file:
+                content = ledger_file.read()
+            with open(path, "wb") as ledger_file:
+                ledger_file.write(content[:start] + content[start + length:])
+
+            for other in self.notes.values():
+                if other[f"{side}_offset"] > start:
+                    other[f"{side}_offset"] -= length
+
+        print(f"Removed previous ledger rows for: {filename}")
+        self.save()
+
+    def discard_rows(self, start_offsets):
+        """
+        Cuts the ledgers back to start_offsets, dropping rows a note appended before writing it failed.
+
+        Parameters:
+            start_offsets (dict): Result of ledger_sizes taken before the note's rows were appended.
+        """
+        for side, path in self.ledgers.items():
+            start = start_offsets[side]
+            if file_size(path) <= start:
+                continue
+            if start == 0:
+                # Only the failed note wrote to this ledger, header included
+                os.remove(path)
+            else:
+                with open(path, "r+b") as ledger_file:
+                    ledger_file.truncate(start)
+
+    def record_note(self, filename, digest, trade_date, buy_rows, sell_rows, start_offsets):
+        """
+        Records a note whose rows were just appended to the ledgers.
+
+        Parameters:
+            filename (str): File name of the contract note.
+            digest (str): Content hash of the note.
+            trade_date (str): Trade date extracted from the note.
+            buy_rows (int): Number of rows appended to the buy ledger.
+            sell_rows (int): Number of rows appended to the sell ledger.
+            start_offsets (dict): Result of ledger_sizes taken before the rows were appended.
+        """
+        end_offsets = self.ledger_sizes()
+        note = {"hash": digest, "trade_date": trade_date, "buy_rows": buy_rows, "sell_rows": sell_rows}
+        for side, path in self.ledgers.items():
+            start = start_offsets[side]
+            if start == 0 and end_offsets[side]:
+                # The first note also wrote the CSV header, which must survive if the note is replaced
+                start = header_length(path)
+            note[f"{side}_offset"] = start
+            note[f"{side}_length"] = end_offsets[side] - start
+        self.notes[filename] = note
+        self.save()
+
+    def save(self):
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding=CSV_ENCODING) as manifest_file:
+            json.dump({"notes": self.notes}, manifest_file, indent=2)
+        os.replace(temp_path, self.manifest_path)
@@ -0,0 +1,159 @@
+import glob
+import os
+import shutil
+
+from constants import (
+    CSV_ENCODING, LEDGER_COLUMNS, LEDGER_STORE_PATH, LEDGER_SIDES,
+    LEDGER_DATE, LEDGER_VOUCHER_TYPE, LEDGER_DAY, LEDGER_MONTH, LEDGER_REF_NO, LEDGER_DR_LEDGER,
+    LEDGER_CR_LEDGER, LEDGER_AMOUNT, LEDGER_NARRATION, LEDGER_QUANTITY, LEDGER_RATE, LEDGER_NOTE,
+)
+
+TRADE_MONTH_PARTITION = "trade_month"
+UNKNOWN_TRADE_MONTH = "unknown"
+LEDGER_DATE_FORMAT = "%d-%m-%Y"
+
+
+def ledger_schema():
+    """
+    Typed schema of the columnar ledger: LEDGER_COLUMNS plus the quantity, rate and source note of each row.
+
+    pyarrow is imported here rather than at module level, so runs that never touch the store do not load it.
+    """
+    import pyarrow as pa
+
+    return pa.schema([
+        (LEDGER_DATE, pa.date32()),
+        (LEDGER_VOUCHER_TYPE, pa.string()),
+        (LEDGER_DAY, pa.int16()),
+        (LEDGER_MONTH, pa.int16()),
+        (LEDGER_REF_NO, pa.string()),
+        (LEDGER_DR_LEDGER, pa.string()),
+        (LEDGER_CR_LEDGER, pa.string()),
+        (LEDGER_AMOUNT, pa.float64()),
+        (LEDGER_NARRATION, pa.string()),
+        (LEDGER_QUANTITY, pa.float64()),
+        (LEDGER_RATE, pa.float64()),
+        (LEDGER_NOTE, pa.string()),
+    ])
+
+
+def to_date(value):
+    """Accepts a datetime.date, datetime or 'YYYY-MM-DD' string and returns a datetime.date."""
+    import pandas as pd
+
+    return pd.Timestamp(value).date()
+
+
+class LedgerStore:
+    """
+    Columnar copy of the buy and sell ledgers, stored as Parquet files partitioned by trade month.
+
+    Each contract note is written to its own file, <store>/<side>/trade_month=YYYY-MM/<note>.parquet, so
+    re-processing a note simply replaces its file.
+
+    Parameters:
+        store_path (str): Folder holding the Parquet dataset.
+    """
+
+    def __init__(self, store_path=LEDGER_STORE_PATH):
+        self.store_path = store_path
+
+    def side_path(self, side):
+        return os.path.join(self.store_path, side)
+
+    def clear(self):
+        """Removes every stored ledger row."""
+        if os.path.exists(self.store_path):
+            shutil.rmtree(self.store_path)
+
+    def note_files(self, note, side):
+        """Returns the Parquet files holding a note's rows for one side, in any trade month."""
+        note_stem = os.path.splitext(note)[0]
+        return glob.glob(os.path.join(self.side_path(side), f"{TRADE_MONTH_PARTITION}=*", f"{note_stem}.parquet"))
+
+    def remove_note(self, note):
+        """Removes the rows of a contract note from every side and month."""
+        for side in LEDGER_SIDES:
+            for part_path in self.note_files(note, side):
+                os.remove(part_path)
+
+    def write_note(self, note, side, ledger_df):
+        """
+        Stores the ledger rows of one note for one side, replacing any rows stored for it before.
+
+        Parameters:
+            note (str): File name of the contract note.
+            side (str): Ledger side, one of LEDGER_SIDES.
+            ledger_df (DataFrame): Ledger rows with LEDGER_COLUMNS plus LEDGER_QUANTITY and LEDGER_RATE.
+        """
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for part_path in self.note_files(note, side):
+            os.remove(part_path)
+        if ledger_df.empty:
+            return
+
+        df = ledger_df.copy()
+        dates = pd.to_datetime(df[LEDGER_DATE], format=LEDGER_DATE_FORMAT, errors="coerce")
+        df[LEDGER_DATE] = dates.dt.date
+        df[LEDGER_DAY] = pd.to_numeric(df[LEDGER_DAY], errors="coerce").astype("Int16")
+        df[LEDGER_MONTH] = pd.to_numeric(df[LEDGER_MONTH], errors="coerce").astype("Int16")
+        df[LEDGER_NOTE] = note
+
+        trade_month = dates.iloc[0].strftime("%Y-%m") if pd.notna(dates.iloc[0]) else UNKNOWN_TRADE_MONTH
+        partition_path = os.path.join(self.side_path(side), f"{TRADE_MONTH_PARTITION}={trade_month}")
+        os.makedirs(partition_path, exist_ok=True)
+
+        schema = ledger_schema()
+        table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+        pq.write_table(table, os.path.join(partition_path, f"{os.path.splitext(note)[0]}.parquet"))
+
+    def query(self, side, columns=None, start_date=None, end_date=None):
+        """
+        Reads ledger rows of one side, loading only the requested columns and trade-month partitions.
+
+        Parameters:
+            side (str): Ledger side, one of LEDGER_SIDES.
+            columns (list): Columns to read. All columns of the ledger schema by default.
+            start_date: First trade date to include (date or 'YYYY-MM-DD'), inclusive.
+            end_date: Last trade date to include (date or 'YYYY-MM-DD'), inclusive.
+
+        Returns:
+            DataFrame: The matching rows with typed date, quantity, rate and amount columns.
+        """
+        import pyarrow.dataset as ds
+
+        schema = ledger_schema()
+        columns = list(columns or schema.names)
+        if not os.path.exists(self.side_path(side)):
+            return schema.empty_table().select(columns).to_pandas()
+
+        dataset = ds.dataset(self.side_path(side), format="parquet", partitioning="hive")
+        row_filter = None
+        if start_date is not None:
+            start_date = to_date(start_date)
+            row_filter = ((ds.field(TRADE_MONTH_PARTITION) >= start_date.strftime("%Y-%m"))
+                          & (ds.field(LEDGER_DATE) >= start_date))
+        if end_date is not None:
+            end_date = to_date(end_date)
+            end_filter = ((ds.field(TRADE_MONTH_PARTITION) <= end_date.strftime("%Y-%m"))
+                          & (ds.field(LEDGER_DATE) <= end_date))
+            row_filter = end_filter if row_filter is None else row_filter & end_filter
+
+        return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+    def export_csv(self, side, csv_path, start_date=None, end_date=None):
+        """
+        Writes one side of the ledger back out in the LEDGER_COLUMNS CSV format used for Tally imports.
+
+        Rows are ordered by trade date and then by note.
+        """
+        import pandas as pd
+
+        df = self.query(side, LEDGER_COLUMNS + [LEDGER_NOTE], start_date, end_date)
+        df = df.sort_values([LEDGER_DATE, LEDGER_NOTE], kind="stable")
+        df[LEDGER_DATE] = pd.to_datetime(df[LEDGER_DATE]).dt.strftime(LEDGER_DATE_FORMAT)
+        df.to_csv(csv_path, columns=LEDGER_COLUMNS, index=False, encoding=CSV_ENCODING)
+        print(f"{side.capitalize()} ledger exported to: {csv_path}")
@@ -0,0 +1,130 @@
+import json
+import time
+from contextlib import contextmanager
+
+from constants import CSV_ENCODING
+
+# Counters collected for every note
+PAGES_SCANNED = "pages_scanned"
+PAGES_WITH_TABLES = "pages_with_tables"
+TABLES_EXTRACTED = "tables_extracted"
+ROWS_EXTRACTED = "rows_extracted"
+BYTES_READ = "bytes_read"
+BYTES_DECRYPTED = "bytes_decrypted"
+BUY_ROWS = "buy_rows"
+SELL_ROWS = "sell_rows"
+
+# Stages timed for every note
+STAGE_HASH = "hash"
+STAGE_CACHE = "cache"
+STAGE_UNLOCK = "unlock"
+STAGE_SCAN_PAGES = "scan_pages"
+STAGE_EXTRACT_TEXT = "extract_text"
+STAGE_EXTRACT_TABLES = "extract_tables"
+STAGE_LEDGER = "ledger"
+STAGE_PNL = "pnl"
+STAGE_MANIFEST = "manifest"
+STAGE_MOVE = "move"
+STAGE_XML = "xml"
+
+# Outcome of a note, recorded as its status
+NOTE_STATUS_WRITTEN = "written"
+NOTE_STATUS_NO_TABLES = "no_tables"
+NOTE_STATUS_UNLOCK_FAILED = "unlock_failed"
+NOTE_STATUS_DUPLICATE = "duplicate"
+NOTE_STATUS_LEDGER_FAILED = "ledger_failed"
+
+
+class NoteMetrics:
+    """
+    Wall time per stage and counters collected while one contract note goes through the pipeline.
+
+    Instances are plain picklable objects, so worker processes can fill one in and return it to the writer.
+
+    Parameters:
+        file_path (str): Path of the contract note being measured.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.status = ""
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Adds the wall time spent inside the with block to stage name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        """Adds the stage times and counters of another NoteMetrics for the same note."""
+        for name, seconds in other.stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        for name, value in other.counters.items():
+            self.add(name, value)
+
+    def total_seconds(self):
+        return sum(self.stages.values())
+
+    def as_dict(self):
+        return {
+            "file": self.file_path,
+            "status": self.status,
+            "total_seconds": round(self.total_seconds(), 6),
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "counters": self.counters,
+        }
+
+
+class MetricsRecorder:
+    """
+    Collects the NoteMetrics of a batch, appending each one as a JSON line and printing a summary table at the end.
+
+    Parameters:
+        jsonl_path (str): Optional path of the JSON lines file metrics are appended to.
+    """
+
+    def __init__(self, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self.notes = []
+        self.batch_stages = {}
+
+    def record(self, metrics):
+        self.notes.append(metrics)
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a", encoding=CSV_ENCODING) as jsonl_file:
+                jsonl_file.write(json.dumps(metrics.as_dict()) + "\n")
+
+    @contextmanager
+    def batch_stage(self, name):
+        """Times a stage that runs once for the whole batch rather than per note."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.batch_stages[name] = self.batch_stages.get(name, 0.0) + time.perf_counter() - start
+
+    def print_summary(self):
+        if not self.notes:
+            return
+
+        totals = NoteMetrics("")
+        for metrics in self.notes:
+            totals.merge(metrics)
+
+        print(f"Pipeline metrics for {len(self.notes)} notes:")
+        print(f"  {'stage':<20}{'total s':>10}{'per note s':>12}")
+        for name, seconds in sorted(totals.stages.items(), key=lambda item: -item[1]):
+            print(f"  {name:<20}{seconds:>10.3f}{seconds / len(self.notes):>12.4f}")
+        for name, seconds in self.batch_stages.items():
+            print(f"  {name + ' (batch)':<20}{seconds:>10.3f}")
+        for name, value in totals.counters.items():
+            print(f"  {name:<20}{value:>10}")
+
@@ -0,0 +1,80 @@
+import os
+from contextlib import nullcontext
+
+from constants import (
+    DOCS_FOLDER_PATH, COMPLETED_FOLDER_PATH, EXTRACTION_CACHE_PATH, BOUGHT_STOCKS_CSV, SOLD_STOCKS_CSV,
+    PROFIT_LOSS_CSV, BUY_LEDGER_CSV, SELL_LEDGER_CSV, LEDGER_MANIFEST_JSON, LEDGER_STORE_PATH, PNL_BOOK_PATH,
+    SECURITY_MASTER_PATH,
+)
+
+
+def open_cache(no_cache=False):
+    """Returns the extraction cache, or an empty context when caching is turned off."""
+    from process.extraction_cache import ExtractionCache
+
+    return nullcontext() if no_cache else ExtractionCache(EXTRACTION_CACHE_PATH)
+
+
+def clear_outputs():
+    """Removes the ledgers, stock and P&L CSVs, manifest, P&L book and ledger store so a run starts fresh."""
+    from process.ledger_store import LedgerStore
+
+    for path in (BOUGHT_STOCKS_CSV, SOLD_STOCKS_CSV, PROFIT_LOSS_CSV, BUY_LEDGER_CSV, SELL_LEDGER_CSV,
+                 LEDGER_MANIFEST_JSON, PNL_BOOK_PATH):
+        if os.path.exists(path):
+            os.remove(path)
+    LedgerStore(LEDGER_STORE_PATH).clear()
+
+
+def run_pipeline(passwd, workers=1, no_cache=False, incremental=False, watch=False, no_parquet=False,
+                 metrics_path=None):
+    """
+    Writes the ledgers, P&L and Tally XML for the notes in DOCS_FOLDER_PATH, or keeps watching the folder.
+
+    Every path is taken from constants, relative to the current directory.
+
+    Parameters:
+        passwd (str or PasswordResolver): Password used to unlock the PDFs, or the resolver that finds the
+            password of each note while it is extracted.
+        workers (int): Number of worker processes used for extraction. 1 processes serially.
+        no_cache (bool): Re-extract every note instead of reusing cached results.
+        incremental (bool): Keep the existing outputs and add only notes that were not processed before.
+        watch (bool): Keep running and process notes as they arrive. Implies incremental.
+        no_parquet (bool): Do not write the Parquet ledger store.
+        metrics_path (str): Optional JSON lines file per-note metrics are appended to.
+
+    Returns:
+        bool: True if the ledgers were updated. Watch mode runs until interrupted and returns False.
+    """
+    from process.ledger_manifest import LedgerManifest
+    from process.ledger_store import LedgerStore
+    from process.pnl_book import ProfitLossBook
+    from process.process_pdf import process_folder
+    from process.security_master import SecurityMaster
+
+    ledger_store = None if no_parquet else LedgerStore(LEDGER_STORE_PATH)
+
+    if not (incremental or watch):
+        clear_outputs()
+    elif not os.path.exists(LEDGER_MANIFEST_JSON) and any(map(os.path.exists, (BUY_LEDGER_CSV, SELL_LEDGER_CSV))):
+        # Without a manifest every note would be appended to the ledgers again
+        print(f"ERROR: The ledgers have no manifest ({LEDGER_MANIFEST_JSON}), so notes already in them cannot be "
+              f"recognised. Run once without --incremental to rebuild them.")
+        return False
+
+    # A full run starts the manifest afresh along with the ledgers, so a later incremental run knows their notes
+    manifest = LedgerManifest(LEDGER_MANIFEST_JSON, BUY_LEDGER_CSV, SELL_LEDGER_CSV)
+
+    # The security master is kept across full runs so a security keeps the ledger name Tally already knows
+    with open_cache(no_cache) as cache, ProfitLossBook(PNL_BOOK_PATH) as pnl_book, \
+            SecurityMaster(SECURITY_MASTER_PATH) as security_master:
+        if watch:
+            from process.watch_folder import watch_folder
+
+            # Notes already in the folder are picked up by the first scans
+            watch_folder(DOCS_FOLDER_PATH, COMPLETED_FOLDER_PATH, passwd, workers, cache, manifest, metrics_path,
+                         ledger_store, pnl_book, security_master)
+            return False
+
+        return process_folder(DOCS_FOLDER_PATH, COMPLETED_FOLDER_PATH, passwd, workers, cache, manifest,
+                              metrics_path, ledger_store, pnl_book, security_master)
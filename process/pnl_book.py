@@ -0,0 +1,223 @@
+import os
+import sqlite3
+from datetime import datetime
+
+from constants import (
+    CSV_ENCODING, PNL_BOOK_PATH, PROFIT_LOSS_CSV, BOUGHT_STOCKS_CSV, SOLD_STOCKS_CSV,
+    PNL_COLUMNS, PNL_TYPE_INTRADAY, PNL_TYPE_DELIVERY, STOCK_TRADE_COLUMNS,
+)
+from process.speculation import parse_trade_date
+
+PNL_DATE_FORMAT = "%d-%m-%Y"
+
+
+class BookingError(Exception):
+    """A note cannot be booked without making the profit and loss book wrong."""
+
+
+class ProfitLossBook:
+    """
+    Realized profit and loss from the contract notes, matching sells against open buy lots first-in-first-out.
+
+    Only the open lots and the names of the notes already applied are kept, in a SQLite file, so applying a
+    note costs time in proportion to its own trades and the lots they close rather than the whole history.
+    Realized rows are appended to the profit and loss CSV, and every buy and sell to the bought and sold CSVs.
+
+    A security bought and sold in the same note is settled as an intraday trade at that note's average rates.
+    Only the remaining quantity opens a lot or is matched against older lots as a delivery trade.
+
+    Notes must be applied in trade date order for the FIFO matching to be correct, so a note older than the notes
+    already booked is refused; the book then has to be rebuilt from all the notes with a full run.
+
+    Parameters:
+        book_path (str): Path to the SQLite file holding the open lots.
+        profit_loss_csv (str): CSV the realized profit and loss rows are appended to.
+        bought_stocks_csv (str): CSV every bought quantity is appended to.
+        sold_stocks_csv (str): CSV every sold quantity is appended to.
+    """
+
+    def __init__(self, book_path=PNL_BOOK_PATH, profit_loss_csv=PROFIT_LOSS_CSV, bought_stocks_csv=BOUGHT_STOCKS_CSV,
+                 sold_stocks_csv=SOLD_STOCKS_CSV):
+        book_folder = os.path.dirname(book_path)
+        if book_folder and not os.path.exists(book_folder):
+            os.makedirs(book_folder)
+
+        self.profit_loss_csv = profit_loss_csv
+        self.bought_stocks_csv = bought_stocks_csv
+        self.sold_stocks_csv = sold_stocks_csv
+        self.connection = sqlite3.connect(book_path, timeout=30)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS lots ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, security TEXT NOT NULL, trade_date TEXT NOT NULL, "
+            "quantity REAL NOT NULL, rate REAL NOT NULL, note TEXT NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS lots_by_security ON lots (security, id)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS notes (note TEXT PRIMARY KEY, trade_date TEXT NOT NULL, digest TEXT)"
+        )
+        # Books created before digests were recorded
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(notes)")]
+        if "digest" not in columns:
+            self.connection.execute("ALTER TABLE notes ADD COLUMN digest TEXT")
+        self.connection.commit()
+
+    def booked_digest(self, note):
+        """Returns (True, digest it was booked with) if a note with this file name was booked, else (False, None)."""
+        row = self.connection.execute("SELECT digest FROM notes WHERE note = ?", (note,)).fetchone()
+        return (False, None) if row is None else (True, row[0])
+
+    def last_trade_date(self):
+        return self.connection.execute("SELECT MAX(trade_date) FROM notes").fetchone()[0]
+
+    def apply_note(self, note, trade_date, trades, security_master=None, digest=None):
+        """
+        Books the trades of one contract note and appends the profit and loss they realize.
+
+        Parameters:
+            note (str): File name of the contract note. A note is only ever applied once.
+            trade_date (str): Trade date of the note in the format 'DD-MMM-YYYY'.
+            trades (list): TradeRow objects of the note.
+            security_master (SecurityMaster): Optional index the ledger names of the securities are looked up in.
+            digest (str): hash_pdf digest of the note, recorded so a changed note with the same name is caught.
+
+        Returns:
+            int: Number of realized profit and loss rows written.
+
+        Raises:
+            BookingError: If the note trades before the last note already booked, or a note with the same file name
+                but different content was booked before.
+        """
+        booked, booked_digest = self.booked_digest(note)
+        if booked:
+            if digest is not None and booked_digest == digest:
+                print(f"Profit and loss already booked for {note}, skipping.")
+                return 0
+            # Its ledger rows were replaced, but the lots it opened and closed cannot be taken back on their own
+            raise BookingError(f"{note} has changed since its profit and loss was booked. Put all the notes back in "
+                               "the docs folder and run without --incremental to rebuild the profit and loss.")
+
+        date = parse_trade_date(trade_date)
+        if date is None:
+            print(f"Cannot book profit and loss for {note}: invalid trade date {trade_date}")
+            return 0
+
+        last_date = self.last_trade_date()
+        if last_date is not None and date.isoformat() < last_date:
+            raise BookingError(f"{note} trades on {trade_date}, before notes already booked up to {last_date}. "
+                               "FIFO matching needs trade date order: put all the notes back in the docs folder "
+                               "and run without --incremental to rebuild the profit and loss.")
+
+        # Bought quantity and value, sold quantity and value per security
+        positions = {}
+        bought_rows, sold_rows = [], []
+        display_date = date.strftime(PNL_DATE_FORMAT)
+        for trade in trades:
+            # Positions are kept per Tally ledger, so they match the ledger names in the buy and sell ledgers
+            if security_master is None:
+                security = trade.ledger_name
+            else:
+                security = security_master.ledger_name(trade.security_desc)
+            position = positions.setdefault(security, [0, 0.0, 0, 0.0])
+            if trade.quantity_bought > 0:
+                position[0] += trade.quantity_bought
+                position[1] += trade.quantity_bought * trade.average_rate
+                bought_rows.append([display_date, security, trade.quantity_bought, trade.average_rate,
+                                    round(trade.quantity_bought * trade.average_rate, 2), note])
+            if trade.quantity_sold > 0:
+                position[2] += trade.quantity_sold
+                position[3] += trade.quantity_sold * trade.average_rate
+                sold_rows.append([display_date, security, trade.quantity_sold, trade.average_rate,
+                                  round(trade.quantity_sold * trade.average_rate, 2), note])
+
+        pnl_rows = []
+        with self.connection:
+            for security, (bought_qty, bought_value, sold_qty, sold_value) in sorted(positions.items()):
+                buy_rate = bought_value / bought_qty if bought_qty else 0.0
+                sell_rate = sold_value / sold_qty if sold_qty else 0.0
+
+                intraday_qty = min(bought_qty, sold_qty)
+                if intraday_qty > 0:
+                    pnl_rows.append(pnl_row(security, PNL_TYPE_INTRADAY, date, date, intraday_qty, buy_rate,
+                                            sell_rate, note))
+                if bought_qty > intraday_qty:
+                    self.connection.execute(
+                        "INSERT INTO lots (security, trade_date, quantity, rate, note) VALUES (?, ?, ?, ?, ?)",
+                        (security, date.isoformat(), bought_qty - intraday_qty, buy_rate, note)
+                    )
+                if sold_qty > intraday_qty:
+                    pnl_rows.extend(self.match_lots(security, date, sold_qty - intraday_qty, sell_rate, note))
+
+            self.connection.execute("INSERT INTO notes (note, trade_date, digest) VALUES (?, ?, ?)",
+                                    (note, date.isoformat(), digest))
+
+            append_csv(pnl_rows, PNL_COLUMNS, self.profit_loss_csv)
+            append_csv(bought_rows, STOCK_TRADE_COLUMNS, self.bought_stocks_csv)
+            append_csv(sold_rows, STOCK_TRADE_COLUMNS, self.sold_stocks_csv)
+
+        return len(pnl_rows)
+
+    def match_lots(self, security, sell_date, quantity, sell_rate, note):
+        """Closes the oldest open lots of a security against a sold quantity and returns the realized rows."""
+        rows = []
+        while quantity > 0:
+            lot = self.connection.execute(
+                "SELECT id, trade_date, quantity, rate FROM lots WHERE security = ? ORDER BY id LIMIT 1", (security,)
+            ).fetchone()
+            if lot is None:
+                print(f"Warning: {note} sells {quantity} {security} without an open buy lot.")
+                rows.append(pnl_row(security, PNL_TYPE_DELIVERY, None, sell_date, quantity, None, sell_rate, note))
+                break
+
+            lot_id, lot_date, lot_quantity, lot_rate = lot
+            matched = min(quantity, lot_quantity)
+            if matched < lot_quantity:
+                self.connection.execute("UPDATE lots SET quantity = ? WHERE id = ?", (lot_quantity - matched, lot_id))
+            else:
+                self.connection.execute("DELETE FROM lots WHERE id = ?", (lot_id,))
+
+            buy_date = datetime.fromisoformat(lot_date).date()
+            rows.append(pnl_row(security, PNL_TYPE_DELIVERY, buy_date, sell_date, matched, lot_rate, sell_rate, note))
+            quantity -= matched
+        return rows
+
+    def open_lots(self, security=None):
+        """Returns the open lots, oldest first, optionally for one security only."""
+        import pandas as pd
+
+        query = "SELECT security, trade_date, quantity, rate, note FROM lots"
+        params = ()
+        if security is not None:
+            query += " WHERE security = ?"
+            params = (security,)
+        rows = self.connection.execute(query + " ORDER BY security, id", params).fetchall()
+        return pd.DataFrame(rows, columns=["Security", "Buy Date", "Quantity", "Rate", "Note"])
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def pnl_row(security, pnl_type, buy_date, sell_date, quantity, buy_rate, sell_rate, note):
+    """Builds a PNL_COLUMNS row. A sell without a matching buy lot has no buy date, rate or profit."""
+    sell_value = round(quantity * sell_rate, 2)
+    if buy_date is None:
+        return [security, pnl_type, "", sell_date.strftime(PNL_DATE_FORMAT), quantity, "", round(sell_rate, 4), "",
+                sell_value, "", "", note]
+
+    buy_value = round(quantity * buy_rate, 2)
+    return [security, pnl_type, buy_date.strftime(PNL_DATE_FORMAT), sell_date.strftime(PNL_DATE_FORMAT), quantity,
+            round(buy_rate, 4), round(sell_rate, 4), buy_value, sell_value, round(sell_value - buy_value, 2),
+            (sell_date - buy_date).days, note]
+
+
+def append_csv(rows, columns, csv_path):
+    if rows:
+        import pandas as pd
+
+        pd.DataFrame(rows, columns=columns).to_csv(csv_path, index=False, encoding=CSV_ENCODING, mode='a',
+                                                   header=not os.path.exists(csv_path))
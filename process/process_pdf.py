@@ -1,43 +1,48 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import pdfplumber
-import pandas as pd
-import re
+# pdfplumber, pikepdf and pandas are imported inside the functions that use them, so that commands which
+# find nothing to extract (or only rebuild the XML) do not pay for loading them.
 import os
-import pikepdf
 import shutil
+from io import BytesIO
+from contextlib import nullcontext
 from datetime import datetime
-import xml.etree.ElementTree as ET
-from xml.dom.minidom import parseString
 
 from constants import (
     # File and folder paths
-    TEMP_UNLOCKED_PDF, CSV_FOLDER_PATH, PDF_EXT, CSV_EXT,
+    TEMP_UNLOCKED_PDF, PDF_EXT, PROFILE_TOP_FUNCTIONS,
 
     # CSV-related constants
-    CSV_ENCODING, CSV_MODE_APPEND, NUM_COLUMNS, BOUGHT_STOCKS_CSV, SOLD_STOCKS_CSV,
+    CSV_ENCODING, BOUGHT_STOCKS_CSV, SOLD_STOCKS_CSV,
     BUY_LEDGER_CSV, SELL_LEDGER_CSV, LEDGER_COLUMNS,
 
-    # Column names and patterns
-    SEGMENT_COLUMN, SECURITY_DESCRIPTION, PARENTHESES_PATTERN, SUB_TOTAL_STRING,
-    COLUMN_SECURITY_DESC, COLUMN_QUANTITY_BOUGHT, COLUMN_QUANTITY_SOLD,
-    COLUMN_TOTAL_GROSS, COLUMN_AVERAGE_RATE,
-
     # Ledger constants
     LEDGER_DATE, LEDGER_VOUCHER_TYPE, LEDGER_DAY, LEDGER_MONTH, LEDGER_REF_NO,
-    LEDGER_DR_LEDGER, LEDGER_CR_LEDGER, LEDGER_AMOUNT, LEDGER_NARRATION,
-    VOUCHER_TYPE, SHARES_LABEL,
+    LEDGER_DR_LEDGER, LEDGER_CR_LEDGER, LEDGER_AMOUNT, LEDGER_NARRATION, LEDGER_QUANTITY, LEDGER_RATE,
+    LEDGER_SIDE_BUY, LEDGER_SIDE_SELL, VOUCHER_TYPE,
 
     # Narration-related
-    NARRATION_QUANTITY, NARRATION_RATE, EMPTY_STRING, CREATE_LEDGER_XML, BROKER_NAME,
+    NARRATION_QUANTITY, NARRATION_RATE, EMPTY_STRING,
 
     # Ledger creation related
-    XML_ENVELOPE, XML_HEADER, XML_TALLYREQUEST, XML_BODY, XML_IMPORT_DATA, XML_REQUESTDESC,
-    XML_REQUESTNAME, REPORT_NAME_ALL_MASTERS, XML_REQUESTDATA, XML_TALLYMESSAGE, TALLY_UDF_NAMESPACE,
-    TALLY_GROUP_NAME, XML_ACTION, XML_ACTION_CREATE, XML_GROUP, XML_NAME, XML_PARENT, TALLY_GROUP_PARENT,
-    CSV_COLUMN_DR_LEDGER, XML_LEDGER, XML_OPENINGBALANCE, CSV_COLUMN_AMOUNT, CSV_COLUMN_NARRATION, XML_NARRATION,
+    LEDGER_FOLDER_PATH, CREATE_LEDGER_XML,
+)
+from process.accounts import PasswordResolver
+from process.extraction_cache import hash_pdf
+from process.speculation import SpeculationTracker, parse_trade_date, trade_date_sort_key
+from process.metrics import (
+    NoteMetrics, MetricsRecorder,
+    STAGE_HASH, STAGE_CACHE, STAGE_UNLOCK, STAGE_SCAN_PAGES, STAGE_EXTRACT_TEXT, STAGE_EXTRACT_TABLES,
+    STAGE_LEDGER, STAGE_PNL, STAGE_MANIFEST, STAGE_MOVE, STAGE_XML,
+    PAGES_SCANNED, PAGES_WITH_TABLES, TABLES_EXTRACTED, ROWS_EXTRACTED, BYTES_READ, BYTES_DECRYPTED,
+    BUY_ROWS, SELL_ROWS,
+    NOTE_STATUS_WRITTEN, NOTE_STATUS_NO_TABLES, NOTE_STATUS_UNLOCK_FAILED, NOTE_STATUS_DUPLICATE,
+    NOTE_STATUS_LEDGER_FAILED,
 )
+from process.tally_xml import write_ledger_xml
+from process.layout_profiles import detect_profile, page_characters
+from process.trade_row import parse_trade_table
 
 
 def move_file(src, dest):
@@ -53,26 +58,60 @@ def move_file(src, dest):
         print(f"An error occurred: {e}")
 
 
-# Function to clean values based on regex pattern
-def clean_value(value):
-    # Check if the value is a string and matches the pattern
-    if isinstance(value, str):
-        # Remove parentheses if they enclose a number
-        return re.sub(PARENTHESES_PATTERN, r'\1', value)
-    return value  # Return the value unchanged if it's not a string
-
-
 # Function to unlock a PDF and save it as a temporary unlocked version
-def unlock_pdf(locked_pdf, passwd):
+def unlock_pdf(locked_pdf, passwd, unlocked_pdf=TEMP_UNLOCKED_PDF):
+    import pikepdf
+
     try:
         with pikepdf.open(locked_pdf, password=passwd) as pdf:
-            pdf.save(TEMP_UNLOCKED_PDF)
+            pdf.save(unlocked_pdf)
         return True
     except Exception as e:
         print(f"Error unlocking PDF: {e}")
         return False
 
 
+# Function to unlock a PDF into memory so the decrypted copy never touches the filesystem
+def unlock_pdf_to_memory(locked_pdf, passwd):
+    import pikepdf
+
+    try:
+        unlocked_pdf = BytesIO()
+        with pikepdf.open(locked_pdf, password=passwd) as pdf:
+            pdf.save(unlocked_pdf)
+        unlocked_pdf.seek(0)
+        return unlocked_pdf
+    except Exception as e:
+        print(f"Error unlocking PDF: {e}")
+        return None
+
+
+def unlock_with_candidates(locked_pdf, candidates):
+    """
+    Unlocks a PDF into memory with the first of several candidate passwords that opens it.
+
+    Returns:
+        tuple: (BytesIO, position of the working candidate), or (None, None) if none of them opens the PDF.
+    """
+    import pikepdf
+
+    for position, password in enumerate(candidates):
+        try:
+            unlocked_pdf = BytesIO()
+            with pikepdf.open(locked_pdf, password=password) as pdf:
+                pdf.save(unlocked_pdf)
+            unlocked_pdf.seek(0)
+            return unlocked_pdf, position
+        except pikepdf.PasswordError:
+            continue
+        except Exception as e:
+            print(f"Error unlocking PDF: {e}")
+            return None, None
+
+    print(f"None of the {len(candidates)} candidate passwords opened {locked_pdf}")
+    return None, None
+
+
 def extract_date_components(trade_date):
     """
     Extracts 'Date', 'Day', and 'Month' from a trade date in the format 'DD-MMM-YYYY'.
@@ -99,282 +138,617 @@ def extract_date_components(trade_date):
         return {"Date": "", "Day": "", "Month": ""}
 
 
-def process_folder(folder_path, completed_folder, passwd):
-    """Function to process all files in a folder and move them to the completed folder."""
+def extract_note(file_path, passwd, metrics=None):
+    """
+    Unlocks a single contract note and extracts its trade tables.
+
+    The note is decrypted into memory rather than a shared file on disk, so it is safe to run from several
+    worker processes at once.
+
+    Parameters:
+        file_path (str): Path to the password-protected contract note.
+        passwd (str or list): Password used to unlock the PDF, or candidate passwords tried in order.
+        metrics (NoteMetrics): Optional metrics the unlock and extraction stages are recorded in.
+
+    Returns:
+        tuple: (trades, trade_date) with a TradeRow per trade, or None if the PDF could not be unlocked.
+    """
+    return unlock_and_extract_note(file_path, passwd, metrics)[0]
+
+
+def unlock_and_extract_note(file_path, passwd, metrics=None):
+    """
+    Runs extract_note and also returns the position of the candidate password that unlocked the note.
+
+    Returns:
+        tuple: (extracted, position), with position None if the PDF could not be unlocked.
+    """
+    if metrics is None:
+        metrics = NoteMetrics(file_path)
+
+    metrics.add(BYTES_READ, os.path.getsize(file_path))
+    with metrics.stage(STAGE_UNLOCK):
+        if isinstance(passwd, list):
+            unlocked_pdf, position = unlock_with_candidates(file_path, passwd)
+        else:
+            unlocked_pdf, position = unlock_pdf_to_memory(file_path, passwd), 0
+    if unlocked_pdf is None:
+        return None, None
+
+    metrics.add(BYTES_DECRYPTED, unlocked_pdf.getbuffer().nbytes)
+    with unlocked_pdf:
+        return extract_tables_from_pdf(unlocked_pdf, metrics), position
+
+
+def note_password(passwd, file_path):
+    """
+    Returns what a note is unlocked with: the one password given for every note, or the candidate passwords of
+    a PasswordResolver in the order they should be tried.
+    """
+    return passwd.ordered_candidates(file_path) if isinstance(passwd, PasswordResolver) else passwd
+
+
+def measure_extract_note(file_path, passwd):
+    """
+    Runs extract_note and returns (extracted, metrics, position), so worker processes can hand back their metrics
+    and which candidate password unlocked the note.
+    """
+    metrics = NoteMetrics(file_path)
+    extracted, position = unlock_and_extract_note(file_path, passwd, metrics)
+    return extracted, metrics, position
+
+
+def write_note(file_path, completed_folder, extracted, manifest=None, digest=None, metrics=None, ledger_store=None,
+               speculation=None, security_master=None):
+    """
+    Appends the ledger rows of one extracted contract note and moves it to the completed folder.
+
+    Parameters:
+        file_path (str): Path to the contract note that was extracted.
+        completed_folder (str): Folder the note is moved to once its ledger rows are written.
+        extracted (tuple): Result of extract_note for this file.
+        manifest (LedgerManifest): Optional manifest of processed notes. Rows written earlier for a note with
+            the same file name are replaced, and the new rows are recorded.
+        digest (str): Content hash of the note, required when a manifest is given.
+        metrics (NoteMetrics): Optional metrics the ledger, manifest and move stages are recorded in.
+        ledger_store (LedgerStore): Optional columnar store the ledger rows are also written to.
+        speculation (SpeculationTracker): Optional running totals the note's trades are added to.
+        security_master (SecurityMaster): Optional index the ledger names of the securities are looked up in.
+
+    The note's trades are booked for profit and loss separately, by book_notes, once the whole batch is written.
+
+    Returns:
+        bool: True if ledger rows were written for the note.
+    """
+    if metrics is None:
+        metrics = NoteMetrics(file_path)
+
+    filename = os.path.basename(file_path)
+    if extracted is None:
+        metrics.status = NOTE_STATUS_UNLOCK_FAILED
+        print(f"Failed to unlock PDF: {filename}")
+        return False
+
+    trades, trade_date = extracted
+    date_components = extract_date_components(trade_date)
+    if trades:
+        if manifest is not None:
+            with metrics.stage(STAGE_MANIFEST):
+                manifest.remove_note(filename)
+                start_offsets = manifest.ledger_sizes()
+
+        with metrics.stage(STAGE_LEDGER):
+            row_counts = process_pdfs_to_ledger_with_new_format(trades, BUY_LEDGER_CSV, SELL_LEDGER_CSV,
+                                                                date_components, ledger_store, filename,
+                                                                security_master)
+        if row_counts is None:
+            # The note stays in the folder, so a later run writes it again from scratch
+            if manifest is not None:
+                with metrics.stage(STAGE_MANIFEST):
+                    manifest.discard_rows(start_offsets)
+            metrics.status = NOTE_STATUS_LEDGER_FAILED
+            print(f"ERROR: Failed to write the ledgers for {filename}, it was left in place")
+            return False
+
+        if speculation is not None:
+            speculation.add_trades(trade_date, trades)
+        metrics.add(BUY_ROWS, row_counts[0])
+        metrics.add(SELL_ROWS, row_counts[1])
+        if manifest is not None:
+            with metrics.stage(STAGE_MANIFEST):
+                manifest.record_note(filename, digest, trade_date, *row_counts, start_offsets)
+
+        with metrics.stage(STAGE_MOVE):
+            move_file(file_path, os.path.join(completed_folder, filename))
+        metrics.status = NOTE_STATUS_WRITTEN
+        print(f"SUCCESS: Processed {filename}")
+        return True
+
+    metrics.status = NOTE_STATUS_NO_TABLES
+    print(f"No valid tables found in {filename}")
+    return False
+
+
+def extract_notes(file_paths, passwd, workers=1, cache=None, note_metrics=None, executor=None, digests=None):
+    """
+    Extracts a batch of contract notes, yielding (file_path, extracted, metrics) in the order of file_paths.
+
+    Notes found in the extraction cache are not decrypted or parsed again. The remaining notes are extracted
+    serially or, with workers > 1, in a process pool. Only this process reads and writes the cache.
+
+    Parameters:
+        file_paths (list): Paths of the contract notes to extract.
+        passwd (str or PasswordResolver): Password used to unlock the PDFs, or the resolver that finds the
+            password of each note while it is extracted.
+        workers (int): Number of worker processes used for extraction. 1 processes serially.
+        cache (ExtractionCache): Optional cache of earlier extraction results.
+        note_metrics (dict): Optional NoteMetrics per file path to record into. Missing entries are created.
+        executor (ProcessPoolExecutor): Optional long-lived pool to extract in instead of starting one per batch.
+        digests (dict): Optional hash_pdf digest per file path, so notes already hashed are not read again.
+    """
+    if note_metrics is None:
+        note_metrics = {}
+    if digests is None:
+        digests = {}
+    for file_path in file_paths:
+        note_metrics.setdefault(file_path, NoteMetrics(file_path))
+
+    cache_keys = {}
+    cached = {}
+    if cache is not None:
+        for file_path in file_paths:
+            metrics = note_metrics[file_path]
+            with metrics.stage(STAGE_HASH):
+                cache_keys[file_path] = cache.key_for(file_path, digests.get(file_path))
+            with metrics.stage(STAGE_CACHE):
+                hit = cache.get(cache_keys[file_path])
+            if hit is not None:
+                cached[file_path] = hit
+
+    misses = [file_path for file_path in file_paths if file_path not in cached]
+    parallel = (workers > 1 or executor is not None) and len(misses) > 1
+    start_pool = parallel and executor is None
+    if start_pool:
+        from concurrent.futures import ProcessPoolExecutor
+
+    # Workers hand back the position of the candidate that unlocked a note, so keep the order it was given in
+    passwords = {}
+
+    def password_of(file_path):
+        passwords[file_path] = note_password(passwd, file_path)
+        return passwords[file_path]
+
+    with ProcessPoolExecutor(max_workers=workers) if start_pool else nullcontext(executor) as executor:
+        if parallel:
+            # map yields results in submission order, which keeps the ledger output deterministic
+            extracted_misses = executor.map(measure_extract_note, misses, [password_of(path) for path in misses])
+        else:
+            # Serially a note's candidates are ordered when it is reached, using what the notes before it taught
+            extracted_misses = (measure_extract_note(file_path, password_of(file_path)) for file_path in misses)
+
+        for file_path in file_paths:
+            metrics = note_metrics[file_path]
+            if file_path in cached:
+                print(f"Using cached extraction for: {file_path}")
+                yield file_path, cached[file_path], metrics
+                continue
+
+            extracted, extract_metrics, position = next(extracted_misses)
+            metrics.merge(extract_metrics)
+            if isinstance(passwd, PasswordResolver) and position is not None:
+                passwd.remember(file_path, passwords[file_path][position])
+            if cache is not None and extracted is not None:
+                with metrics.stage(STAGE_CACHE):
+                    cache.put(cache_keys[file_path], extracted)
+            yield file_path, extracted, metrics
+
+
+def list_notes(folder_path):
+    """Returns the paths of the contract notes (PDF files) in a folder, in sorted filename order."""
+    return [os.path.join(folder_path, filename) for filename in sorted(os.listdir(folder_path))
+            if filename.lower().endswith(PDF_EXT)]
+
+
+def process_folder(folder_path, completed_folder, passwd, workers=1, cache=None, manifest=None, metrics_path=None,
+                   ledger_store=None, pnl_book=None, security_master=None):
+    """
+    Function to process all files in a folder and move them to the completed folder.
+
+    Files are handled in sorted filename order. With workers > 1, decryption and table extraction run in a
+    process pool while this process stays the single writer of the ledger files, appending results in the
+    same order as a serial run so the output is identical.
+
+    Parameters:
+        folder_path (str): Folder containing the contract notes to process.
+        completed_folder (str): Folder processed notes are moved to.
+        passwd (str or PasswordResolver): Password used to unlock the PDFs, or the resolver that finds the
+            password of each note while it is extracted.
+        workers (int): Number of worker processes used for extraction. 1 processes serially.
+        cache (ExtractionCache): Optional cache used to skip notes that were already extracted.
+        manifest (LedgerManifest): Optional manifest of the notes in the ledgers. Notes whose content is already in
+            the ledgers are skipped, and a changed note replaces only its own rows.
+        metrics_path (str): Optional JSON lines file that per-note stage timings and counters are appended to.
+            A summary table is printed at the end of the batch either way.
+        ledger_store (LedgerStore): Optional columnar store written alongside the ledger CSVs.
+        pnl_book (ProfitLossBook): Optional profit and loss book the written notes are booked in, by trade date.
+        security_master (SecurityMaster): Optional index mapping security descriptions to Tally ledger names.
+
+    Speculative (intraday) trades are collected while the ledgers are written and reported once for the batch.
+
+    Returns:
+        bool: True if the ledgers were updated.
+    """
+    return process_notes(list_notes(folder_path), completed_folder, passwd, workers, cache, manifest, metrics_path,
+                         ledger_store, pnl_book, security_master)
+
+
+def process_notes(file_paths, completed_folder, passwd, workers=1, cache=None, manifest=None, metrics_path=None,
+                  ledger_store=None, pnl_book=None, security_master=None, executor=None):
+    """
+    Processes a batch of contract notes in the given order and moves them to the completed folder.
+
+    Takes the same parameters as process_folder, with the note paths given explicitly, plus an optional
+    long-lived process pool (executor) used for extraction.
+
+    Returns:
+        bool: True if the ledgers were updated.
+    """
     if not os.path.exists(completed_folder):
         os.makedirs(completed_folder)
 
-    # Loop through all files in the folder
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith(PDF_EXT):  # Only process PDF files
-            file_path = os.path.join(folder_path, filename)
-            print(f"Processing file: {file_path}")
-
-            if unlock_pdf(file_path, passwd):
-                filtered_tables, trade_date = extract_tables_from_pdf(TEMP_UNLOCKED_PDF)
-                date_components = extract_date_components(trade_date)
-                if filtered_tables:
-                    process_pdfs_to_ledger_with_new_format(filtered_tables, BUY_LEDGER_CSV, SELL_LEDGER_CSV,
-                                                           date_components)
-                    generate_ledger_xml(BUY_LEDGER_CSV)
-                    move_file(file_path, os.path.join(completed_folder, filename))
-                    print(f"SUCCESS: Processed {filename}")
-                else:
-                    print(f"No valid tables found in {filename}")
+    recorder = MetricsRecorder(metrics_path)
+    note_metrics = {file_path: NoteMetrics(file_path) for file_path in file_paths}
+
+    # Each note is read for hashing once, and the digest shared by the manifest, the cache and the P&L book
+    digests = {}
+    if manifest is not None or cache is not None or pnl_book is not None:
+        for file_path in file_paths:
+            with note_metrics[file_path].stage(STAGE_HASH):
+                digests[file_path] = hash_pdf(file_path)
+
+    if manifest is not None:
+        new_file_paths = []
+        for file_path in file_paths:
+            metrics = note_metrics[file_path]
+            if manifest.is_duplicate(digests[file_path]):
+                print(f"Skipping already processed file: {file_path}")
+                with metrics.stage(STAGE_MOVE):
+                    move_file(file_path, os.path.join(completed_folder, os.path.basename(file_path)))
+                metrics.status = NOTE_STATUS_DUPLICATE
+                recorder.record(metrics)
             else:
-                print(f"Failed to unlock PDF: {filename}")
+                new_file_paths.append(file_path)
+        file_paths = new_file_paths
+
+    speculation = SpeculationTracker()
+    written_notes = []
+    for file_path, extracted, metrics in extract_notes(file_paths, passwd, workers, cache, note_metrics, executor,
+                                                       digests):
+        print(f"Processing file: {file_path}")
+        if write_note(file_path, completed_folder, extracted, manifest, digests.get(file_path), metrics,
+                      ledger_store, speculation, security_master):
+            written_notes.append((os.path.basename(file_path), extracted, digests.get(file_path), metrics))
+        else:
+            recorder.record(metrics)
+    ledger_updated = bool(written_notes)
 
+    if pnl_book is not None:
+        book_notes(pnl_book, written_notes, security_master)
+    for _, _, _, metrics in written_notes:
+        recorder.record(metrics)
 
-# Open the PDF file
-def process_file(lockedpdf, passwd):
-    try:
-        filtered_tables = []
-        with pikepdf.open(lockedpdf, password=passwd) as pdf:
-            pdf.save(TEMP_UNLOCKED_PDF)
-        with pdfplumber.open(TEMP_UNLOCKED_PDF) as pdf:
+    # Rebuild the Tally import file once for the whole batch rather than after every note
+    if ledger_updated and os.path.exists(BUY_LEDGER_CSV):
+        with recorder.batch_stage(STAGE_XML):
+            generate_ledger_xml(BUY_LEDGER_CSV)
 
-            for page_number, page in enumerate(pdf.pages, start=1):
-                tables = page.extract_tables()
+    if ledger_updated:
+        speculation.print_report()
+    recorder.print_summary()
+    return ledger_updated
 
-                # Loop through each table in the page
-                for table_idx, table in enumerate(tables):
-                    if table:  # Check if table is not empty
-                        header = table[0]  # Assuming first row is the header
 
-                    # Check if the header contains a column named 'Segment' and has 11 columns
-                    if SEGMENT_COLUMN in header and len(header) == NUM_COLUMNS:
-                        # Filter rows with exactly 11 columns
-                        filtered_table = [row for row in table if len(row) == NUM_COLUMNS]
+def book_notes(pnl_book, written_notes, security_master=None):
+    """
+    Books the trades of a batch of written notes for profit and loss, oldest trade date first.
 
-                        # Remove rows that contain "Sub Total"
-                        filtered_table = [row for row in filtered_table if SUB_TOTAL_STRING not in row]
+    FIFO matching needs the notes in trade date order, which broker file names do not follow. Notes with the same
+    trade date are booked in batch order. A note the book refuses is reported and the rest are still booked.
 
-                        # Apply the cleaning function to all values in the filtered table
-                        filtered_table = [[clean_value(cell) for cell in row] for row in filtered_table]
+    Parameters:
+        pnl_book (ProfitLossBook): The profit and loss book.
+        written_notes (list): (filename, (trades, trade_date), digest, metrics) of every note whose ledgers were
+            written.
+        security_master (SecurityMaster): Optional index the ledger names of the securities are looked up in.
+    """
+    from process.pnl_book import BookingError
 
-                        # Only append the table if rows still remain after filtering
-                        if filtered_table:
-                            filtered_tables.append(filtered_table)
+    by_trade_date = sorted(written_notes, key=lambda note: trade_date_sort_key(parse_trade_date(note[1][1])))
+    for filename, (trades, trade_date), digest, metrics in by_trade_date:
+        with metrics.stage(STAGE_PNL):
+            try:
+                pnl_book.apply_note(filename, trade_date, trades, security_master, digest)
+            except BookingError as e:
+                print(f"ERROR: {e}")
 
-            if not filtered_tables:
-                print("No tables with the specified criteria found in the document.")
 
-        # Export each filtered table to a CSV file using pandas
-        file_name = os.path.splitext(os.path.basename(lockedpdf))[0]
-        csv_filename = f'{CSV_FOLDER_PATH}/{file_name}{CSV_EXT}'
+def profile_note(file_path, passwd, stats_path=None):
+    """
+    Runs extraction and ledger building for a single note under cProfile and prints the hottest functions.
 
-        for idx, table in enumerate(filtered_tables):
-            df = pd.DataFrame(table[1:], columns=table[0])  # Convert to DataFrame with header
+    Ledger rows are written to a temporary folder, so the real ledgers and the note itself are left untouched.
 
-            # Strip leading and trailing spaces from all string columns
-            string_columns = df.select_dtypes(include=['object']).columns  # Get all string columns
+    Parameters:
+        file_path (str): Path to the contract note to profile.
+        passwd (str): Password used to unlock the PDF.
+        stats_path (str): Optional path to save the raw profile, for tools such as snakeviz.
+    """
+    import cProfile
+    import pstats
+    import tempfile
+
+    profiler = cProfile.Profile()
+    with tempfile.TemporaryDirectory() as work_dir:
+        profiler.enable()
+        extracted = extract_note(file_path, passwd)
+        if extracted is not None and extracted[0]:
+            trades, trade_date = extracted
+            process_pdfs_to_ledger_with_new_format(trades, os.path.join(work_dir, "buy.csv"),
+                                                   os.path.join(work_dir, "sell.csv"),
+                                                   extract_date_components(trade_date))
+        profiler.disable()
+
+    stats = pstats.Stats(profiler).sort_stats(pstats.SortKey.CUMULATIVE)
+    stats.print_stats(PROFILE_TOP_FUNCTIONS)
+    if stats_path:
+        stats.dump_stats(stats_path)
+        print(f"Profile saved to: {stats_path}")
 
-            df[string_columns] = df[string_columns].apply(lambda x: x.str.strip())
 
-            # For the first table, write header:
-            if idx == 0:
-                df.to_csv(csv_filename, index=False, encoding=CSV_ENCODING)
-            else:
-                # For subsequent tables, append without header:
-                df.to_csv(csv_filename, index=False, mode=CSV_MODE_APPEND, header=False)
+# Open the PDF file
+def process_file(lockedpdf, passwd):
+    try:
+        extracted = extract_note(lockedpdf, passwd)
+        if extracted is None:
+            return False
+
+        trades, trade_date = extracted
+        if not trades:
+            print("No tables with the specified criteria found in the document.")
 
-        identify_speculation(csv_filename)
+        identify_speculation(trades, trade_date)
         return True
     except Exception as e:
         print(f"ERROR: {lockedpdf} An unexpected error occurred: {e}")
 
 
-# Function to process a single PDF file and extract tables
-def extract_tables_from_pdf(pdf_path):
-    filtered_tables = []
-    trade_date = ''
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_number, page in enumerate(pdf.pages, start=1):
-            tables = page.extract_tables()
-            trade_date_match = re.search(r"Trade Date\s*(\d{1,2}-[a-zA-Z]{3}-\d{4})", page.extract_text())
-
-            if trade_date_match:
-                if trade_date == '':
-                    trade_date = trade_date_match.group(1)
-                    print('Trade date: ', trade_date)
+def iter_trade_pages(pdf_path, metrics=None):
+    """
+    Yields (page_number, trade_date, trades) for every page, one page at a time.
 
-            for table_idx, table in enumerate(tables):
-                if table:
-                    header = table[0]
-                    if SEGMENT_COLUMN in header and len(header) == NUM_COLUMNS:
-                        filtered_table = [row for row in table if len(row) == NUM_COLUMNS]
-                        filtered_table = [
-                            [clean_value(cell) for cell in row] for row in filtered_table
-                            if SUB_TOTAL_STRING not in row
-                        ]
+    The broker layout is detected once from page 1, and each page holding a trade table is cropped to the table
+    region before table extraction. Every page is closed as soon as it has been read, which releases the
+    characters and layout objects pdfplumber caches for it, so memory stays flat however many pages the
+    document has.
 
-                        if filtered_table:
-                            filtered_tables.append(filtered_table)
-                            print(f"Table {table_idx + 1} on page {page_number} meets the criteria.")
-    return filtered_tables, trade_date
+    Parameters:
+        pdf_path: A file path or a file-like object such as the buffer returned by unlock_pdf_to_memory.
+        metrics (NoteMetrics): Optional metrics the page counts, table rows and pdfplumber calls are recorded in.
 
+    Yields:
+        tuple: The page number, the trade date found so far ('' until it is found) and the page's TradeRows,
+        which is empty for pages without trade tables.
+    """
+    import pdfplumber
 
-def identify_speculation(file_path):
-    print(f"Identifying speculative trades in a CSV file: ", file_path)
+    if metrics is None:
+        metrics = NoteMetrics(pdf_path)
 
-    data = pd.read_csv(file_path)
-    data.columns = [col.strip() for col in data.columns]
+    trade_date = ''
+    profile = None
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_number, page in enumerate(pdf.pages, start=1):
+            try:
+                page_trades = extract_page_trades(page, page_number, profile, trade_date, metrics)
+            finally:
+                page.close()
+            profile, trade_date, trades = page_trades
+            yield page_number, trade_date, trades
 
-    # Clean up the "Security description" column by removing newlines and extra spaces
-    data[SECURITY_DESCRIPTION] = data[SECURITY_DESCRIPTION].str.replace('\n', ' ', regex=False).str.strip()
 
-    # Adjust column names to match dataset
-    bought_col = [col for col in data.columns if "Bought" in col]
-    sold_col = [col for col in data.columns if "Sold" in col]
+def extract_page_trades(page, page_number, profile, trade_date, metrics):
+    """
+    Reads the trade date and trade tables of one page.
 
-    if not bought_col or not sold_col:
-        raise ValueError("Columns for 'bought' or 'sold' quantities not found in the dataset.")
+    Returns:
+        tuple: (profile, trade_date, trades) with the profile detected on page 1 and the trade date found so far.
+    """
+    metrics.add(PAGES_SCANNED)
+    with metrics.stage(STAGE_SCAN_PAGES):
+        chars, page_text = page_characters(page)
+
+    # Page 1's extract_text keeps the spaces multi-word detect patterns need, and is reused for the trade date
+    layout_text = None
+    if profile is None:
+        with metrics.stage(STAGE_EXTRACT_TEXT):
+            layout_text = page.extract_text()
+        profile = detect_profile(layout_text)
+    has_table_marker, has_trade_date_marker = profile.scan_markers(page_text)
+
+    # Stop looking for the trade date once it has been found
+    if trade_date == '' and has_trade_date_marker:
+        with metrics.stage(STAGE_EXTRACT_TEXT):
+            if layout_text is None:
+                layout_text = page.extract_text()
+            found_date = profile.find_trade_date(layout_text)
+        if found_date:
+            trade_date = found_date
+            print('Trade date: ', trade_date)
+
+    # Pages without the trade table header never pass the filter below
+    trades = []
+    if not has_table_marker:
+        return profile, trade_date, trades
+
+    with metrics.stage(STAGE_EXTRACT_TABLES):
+        region = profile.table_region(page, chars)
+        tables = region.extract_tables()
+        if region is not page and not any(table and profile.is_trade_table(table[0]) for table in tables):
+            # The crop cut into the trade table, so read the whole page rather than drop its trades
+            tables = page.extract_tables()
+    for table_idx, table in enumerate(tables):
+        if table and profile.is_trade_table(table[0]):
+            filtered_table = profile.trade_rows(table)
+
+            if filtered_table:
+                try:
+                    table_trades = parse_trade_table(filtered_table, profile.column_map, profile.broker_name)
+                except ValueError as e:
+                    print(f"Skipping table {table_idx + 1} on page {page_number}: {e}")
+                    continue
+
+                trades.extend(table_trades)
+                metrics.add(TABLES_EXTRACTED)
+                metrics.add(ROWS_EXTRACTED, len(table_trades))
+                print(f"Table {table_idx + 1} on page {page_number} meets the criteria.")
+    if trades:
+        metrics.add(PAGES_WITH_TABLES)
+    return profile, trade_date, trades
+
+
+# Function to process a single PDF file and extract its trades as TradeRow objects.
+# pdf_path may be a file path or a file-like object such as the buffer returned by unlock_pdf_to_memory.
+# Page counts, table rows and the time spent in each pdfplumber call are recorded in metrics when given.
+def extract_tables_from_pdf(pdf_path, metrics=None):
+    trades = []
+    trade_date = ''
+    for _, trade_date, page_trades in iter_trade_pages(pdf_path, metrics):
+        trades.extend(page_trades)
+    if trades and trade_date == '':
+        print("Warning: trade tables found but no trade date; the ledger rows will have no date.")
+    return trades, trade_date
 
-    bought_col = bought_col[0]
-    sold_col = sold_col[0]
 
-    # Group by "Security description" and sum the bought and sold quantities
-    grouped = data.groupby(SECURITY_DESCRIPTION)[[bought_col, sold_col]].sum()
+def identify_speculation(trades, trade_date=None):
+    """
+    Reports securities that were both bought and sold (intraday speculation) in a list of trades.
 
-    # Filter stocks where both bought and sold quantities are greater than 0
-    speculation = grouped[(grouped[bought_col] > 0) & (grouped[sold_col] > 0)]
+    Parameters:
+        trades (list): TradeRow objects of one contract note.
+        trade_date (str): Optional trade date of the note in the format 'DD-MMM-YYYY'.
+    """
+    tracker = SpeculationTracker()
+    tracker.add_trades(trade_date, trades)
+    tracker.print_report()
 
-    # Print the speculative stocks with bought and sold quantities
-    if not speculation.empty:
-        for stock in speculation.index:
-            bought_qty = speculation.loc[stock, bought_col]
-            sold_qty = speculation.loc[stock, sold_col]
-            print(f"Speculation detected for stock:\n {stock} | Bought: {bought_qty} | Sold: {sold_qty}")
-    else:
-        print("No speculative trades found.")
 
+def build_ledger_frame(date_components, dr_ledger, cr_ledger, amount, narration, quantity, rate):
+    """
+    Builds ledger rows in the LEDGER_COLUMNS format from per-row columns and per-note constants.
 
-def process_pdfs_to_ledger_with_new_format(filtered_tables, buy_ledger_csv, sell_ledger_csv, date_components):
+    The numeric quantity and rate are kept as extra columns for the columnar ledger store; they are not written
+    to the ledger CSVs.
+    """
+    import pandas as pd
+
+    return pd.DataFrame({
+        LEDGER_DATE: date_components[LEDGER_DATE],
+        LEDGER_VOUCHER_TYPE: VOUCHER_TYPE,
+        LEDGER_DAY: date_components[LEDGER_DAY],
+        LEDGER_MONTH: date_components[LEDGER_MONTH],
+        LEDGER_REF_NO: EMPTY_STRING,
+        LEDGER_DR_LEDGER: dr_ledger,
+        LEDGER_CR_LEDGER: cr_ledger,
+        LEDGER_AMOUNT: amount,
+        LEDGER_NARRATION: narration,
+        LEDGER_QUANTITY: quantity,
+        LEDGER_RATE: rate,
+    }, columns=LEDGER_COLUMNS + [LEDGER_QUANTITY, LEDGER_RATE])
+
+
+def process_pdfs_to_ledger_with_new_format(trades, buy_ledger_csv, sell_ledger_csv, date_components,
+                                           ledger_store=None, note=None, security_master=None):
     """
-    Processes filtered tables from PDFs and creates buy and sell ledger CSV files with the specified format.
+    Processes the trades of a contract note and creates buy and sell ledger CSV files with the specified format.
 
     Parameters:
-        filtered_tables (list): List of tables extracted from PDFs.
+        trades (list): TradeRow objects extracted from the PDF.
         buy_ledger_csv (str): Path to the CSV file where the buy ledger will be saved.
         sell_ledger_csv (str): Path to the CSV file where the sell ledger will be saved.
         date_components (dict): Value of Date, Day and Month calculated from trade date.
+        ledger_store (LedgerStore): Optional columnar store the rows are also written to.
+        note (str): File name of the contract note, required when a ledger store is given.
+        security_master (SecurityMaster): Optional index the ledger names of the securities are looked up in.
+
+    Returns:
+        tuple: Number of buy and sell ledger rows written, or None if processing failed.
     """
     try:
-        # Initialize lists to store buy and sell ledger entries
-        buy_ledger_entries = []
-        sell_ledger_entries = []
-
-        # Process each table in the filtered tables
-        for table in filtered_tables:
-            # Convert the table (a list of lists) into a DataFrame
-            df = pd.DataFrame(table[1:], columns=table[0])  # Create DataFrame with headers
-
-            # Clean and standardize column names
-            df.columns = (
-                df.columns.str.strip()
-                .str.replace(r'\s+', ' ', regex=True)  # Replace multiple spaces with single space
-            )
-
-            # Strip spaces from all string columns
-            string_columns = df.select_dtypes(include=["object"]).columns
-            df[string_columns] = df[string_columns].apply(lambda x: x.str.strip())
-
-            # Ensure relevant columns are numeric (replace invalid entries with 0)
-            numeric_columns = [COLUMN_QUANTITY_BOUGHT, COLUMN_QUANTITY_SOLD, COLUMN_TOTAL_GROSS, COLUMN_AVERAGE_RATE]
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-
-            # Process each row in the DataFrame
-            for _, row in df.iterrows():
-                # Check for Buy Entries
-                if row[COLUMN_QUANTITY_BOUGHT] > 0:
-                    # Extract and process the security description
-                    security_desc = row[COLUMN_SECURITY_DESC].split('-')[0].strip() + ' ' + SHARES_LABEL
-
-                    buy_ledger_entries.append({
-                        LEDGER_DATE: date_components[LEDGER_DATE],
-                        LEDGER_VOUCHER_TYPE: VOUCHER_TYPE,
-                        LEDGER_DAY: date_components[LEDGER_DAY],
-                        LEDGER_MONTH: date_components[LEDGER_MONTH],
-                        LEDGER_REF_NO: EMPTY_STRING,
-                        LEDGER_DR_LEDGER: security_desc,
-                        LEDGER_CR_LEDGER: BROKER_NAME,
-                        LEDGER_AMOUNT: row[COLUMN_TOTAL_GROSS],
-                        LEDGER_NARRATION: f"{NARRATION_QUANTITY}: {row[COLUMN_QUANTITY_BOUGHT]}, "
-                                          f"{NARRATION_RATE}: {row[COLUMN_AVERAGE_RATE]}"
-                    })
-
-                # Check for Sell Entries
-                if row[COLUMN_QUANTITY_SOLD] > 0:
-                    # Extract and process the security description
-                    security_desc = row[COLUMN_SECURITY_DESC].split('-')[0].strip() + ' ' + SHARES_LABEL
-                    sell_ledger_entries.append({
-                        LEDGER_DATE: date_components[LEDGER_DATE],
-                        LEDGER_VOUCHER_TYPE: VOUCHER_TYPE,
-                        LEDGER_DAY: date_components[LEDGER_DAY],
-                        LEDGER_MONTH: date_components[LEDGER_MONTH],
-                        LEDGER_REF_NO: EMPTY_STRING,
-                        LEDGER_DR_LEDGER: BROKER_NAME,
-                        LEDGER_CR_LEDGER: security_desc,
-                        LEDGER_AMOUNT: row[COLUMN_TOTAL_GROSS],
-                        LEDGER_NARRATION: f"{NARRATION_QUANTITY}: {row[COLUMN_QUANTITY_SOLD]}, "
-                                          f"{NARRATION_RATE}: {row[COLUMN_AVERAGE_RATE]}"
-                    })
+        if security_master is None:
+            ledger_names = [trade.ledger_name for trade in trades]
+        else:
+            ledger_names = [security_master.ledger_name(trade.security_desc) for trade in trades]
+        buys = [trade for trade in trades if trade.quantity_bought > 0]
+        buy_names = [name for name, trade in zip(ledger_names, trades) if trade.quantity_bought > 0]
+        sell_names = [name for name, trade in zip(ledger_names, trades) if trade.quantity_sold > 0]
+        sells = [trade for trade in trades if trade.quantity_sold > 0]
+
+        buy_ledger_df = build_ledger_frame(
+            date_components,
+            buy_names,
+            [trade.broker for trade in buys],
+            [trade.total_gross for trade in buys],
+            [f"{NARRATION_QUANTITY}: {trade.quantity_bought}, {NARRATION_RATE}: {trade.average_rate}"
+             for trade in buys],
+            [trade.quantity_bought for trade in buys],
+            [trade.average_rate for trade in buys],
+        )
+        sell_ledger_df = build_ledger_frame(
+            date_components,
+            [trade.broker for trade in sells],
+            sell_names,
+            [trade.total_gross for trade in sells],
+            [f"{NARRATION_QUANTITY}: {trade.quantity_sold}, {NARRATION_RATE}: {trade.average_rate}"
+             for trade in sells],
+            [trade.quantity_sold for trade in sells],
+            [trade.average_rate for trade in sells],
+        )
 
         # Save the buy ledger entries to the specified CSV file
-        if buy_ledger_entries:
-            buy_ledger_df = pd.DataFrame(buy_ledger_entries, columns=LEDGER_COLUMNS)
-            buy_ledger_df.to_csv(buy_ledger_csv, index=False, encoding=CSV_ENCODING, mode='a',
-                                 header=not os.path.exists(buy_ledger_csv))
+        if not buy_ledger_df.empty:
+            buy_ledger_df.to_csv(buy_ledger_csv, columns=LEDGER_COLUMNS, index=False, encoding=CSV_ENCODING,
+                                 mode='a', header=not os.path.exists(buy_ledger_csv))
             print(f"Buy ledger saved to: {buy_ledger_csv}")
         else:
             print("No buy data found. Buy ledger CSV not created.")
 
         # Save the sell ledger entries to the specified CSV file
-        if sell_ledger_entries:
-            sell_ledger_df = pd.DataFrame(sell_ledger_entries, columns=LEDGER_COLUMNS)
-            sell_ledger_df.to_csv(sell_ledger_csv, index=False, encoding=CSV_ENCODING, mode='a',
-                                  header=not os.path.exists(sell_ledger_csv))
+        if not sell_ledger_df.empty:
+            sell_ledger_df.to_csv(sell_ledger_csv, columns=LEDGER_COLUMNS, index=False, encoding=CSV_ENCODING,
+                                  mode='a', header=not os.path.exists(sell_ledger_csv))
             print(f"Sell ledger saved to: {sell_ledger_csv}")
         else:
             print("No sell data found. Sell ledger CSV not created.")
 
     except Exception as e:
         print(f"Error occurred during ledger processing: {e}")
+        return None
+
+    if ledger_store is not None:
+        try:
+            ledger_store.write_note(note, LEDGER_SIDE_BUY, buy_ledger_df)
+            ledger_store.write_note(note, LEDGER_SIDE_SELL, sell_ledger_df)
+        except Exception as e:
+            # Leave no half-written note behind in the store either
+            ledger_store.remove_note(note)
+            print(f"Error occurred while writing the ledger store for {note}: {e}")
+            return None
+
+    return len(buy_ledger_df), len(sell_ledger_df)
 
 
 def generate_ledger_xml(csv_path):
-    df = pd.read_csv(csv_path)
-
-    envelope = ET.Element(XML_ENVELOPE)
-    header = ET.SubElement(envelope, XML_HEADER)
-    ET.SubElement(header, XML_TALLYREQUEST).text = "Import Data"
-
-    body = ET.SubElement(envelope, XML_BODY)
-    import_data = ET.SubElement(body, XML_IMPORT_DATA)
-    request_desc = ET.SubElement(import_data, XML_REQUESTDESC)
-    ET.SubElement(request_desc, XML_REQUESTNAME).text = REPORT_NAME_ALL_MASTERS
-
-    request_data = ET.SubElement(import_data, XML_REQUESTDATA)
-
-    tally_message_group = ET.SubElement(request_data, XML_TALLYMESSAGE, {"xmlns:UDF": TALLY_UDF_NAMESPACE})
-    group = ET.SubElement(tally_message_group, XML_GROUP, {"NAME": TALLY_GROUP_NAME, XML_ACTION: XML_ACTION_CREATE})
-    ET.SubElement(group, XML_NAME).text = TALLY_GROUP_NAME
-    ET.SubElement(group, XML_PARENT).text = TALLY_GROUP_PARENT
-
-    for _, row in df.iterrows():
-        dr_ledger = row[CSV_COLUMN_DR_LEDGER].replace("\n", "").strip()
-        tally_message_ledger = ET.SubElement(request_data, XML_TALLYMESSAGE, {"xmlns:UDF": TALLY_UDF_NAMESPACE})
-        ledger = ET.SubElement(tally_message_ledger, XML_LEDGER, {"NAME": dr_ledger, XML_ACTION: XML_ACTION_CREATE})
-        ET.SubElement(ledger, XML_NAME).text = dr_ledger
-        ET.SubElement(ledger, XML_PARENT).text = TALLY_GROUP_NAME
-        ET.SubElement(ledger, XML_OPENINGBALANCE).text = str(row[CSV_COLUMN_AMOUNT])
-        ET.SubElement(ledger, XML_NARRATION).text = row[CSV_COLUMN_NARRATION]
-
-    xml_str = ET.tostring(envelope, encoding='unicode')
-    parsed_xml = parseString(xml_str)
-    pretty_xml = parsed_xml.toprettyxml(indent="  ")
-
-    with open(CREATE_LEDGER_XML, "w") as xml_file:
-        xml_file.write(pretty_xml)
+    """Writes the Tally ledger import file for a ledger CSV to CREATE_LEDGER_XML, streaming it chunk by chunk."""
+    if not os.path.exists(LEDGER_FOLDER_PATH):
+        os.makedirs(LEDGER_FOLDER_PATH)
+    write_ledger_xml(csv_path, CREATE_LEDGER_XML)
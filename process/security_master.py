@@ -0,0 +1,94 @@
+import os
+import re
+import sqlite3
+
+from constants import SECURITY_MASTER_PATH, SHARES_LABEL
+
+# ISO 6166: two letter country code, nine alphanumeric characters and a check digit, e.g. INE848E01016
+ISIN_REGEX = re.compile(r"(?<![A-Z0-9])([A-Z]{2}[A-Z0-9]{9}\d)(?![A-Z0-9])")
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+def normalize_ledger_name(name):
+    """Removes the line breaks a PDF cell leaves inside a name, as Tally ledger names are single line."""
+    return name.replace("\n", "").strip()
+
+
+def ledger_name_from_desc(security_desc):
+    """Tally ledger name built from a security description, e.g. 'NHPC LIMITED-EQ' -> 'NHPC LIMITED SHARES'."""
+    return normalize_ledger_name(security_desc.split('-')[0]) + ' ' + SHARES_LABEL
+
+
+def find_isin(text):
+    """Returns the ISIN in a security description, ignoring line breaks inside it, or None."""
+    match = ISIN_REGEX.search(WHITESPACE_REGEX.sub("", text.upper()))
+    return match.group(1) if match else None
+
+
+class SecurityMaster:
+    """
+    Persistent index of the security descriptions seen in contract notes and the Tally ledger each maps to.
+
+    The first description seen with a name for an ISIN fixes the ledger name of that ISIN, so later notes that
+    give the same security as a bare ISIN or with its name broken across lines differently still post to the
+    same ledger. Lookups are memoized in memory, and only descriptions never seen before touch the SQLite file.
+
+    Parameters:
+        index_path (str): Path to the SQLite file holding the index.
+    """
+
+    def __init__(self, index_path=SECURITY_MASTER_PATH):
+        index_folder = os.path.dirname(index_path)
+        if index_folder and not os.path.exists(index_folder):
+            os.makedirs(index_folder)
+
+        self.names = {}
+        self.connection = sqlite3.connect(index_path, timeout=30)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions (description TEXT PRIMARY KEY, isin TEXT, "
+            "ledger_name TEXT NOT NULL)"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS isins (isin TEXT PRIMARY KEY, ledger_name TEXT NOT NULL)")
+        self.connection.commit()
+
+    def ledger_name(self, security_desc):
+        """Returns the canonical Tally ledger name of a security description, recording it if it is new."""
+        name = self.names.get(security_desc)
+        if name is not None:
+            return name
+
+        row = self.connection.execute(
+            "SELECT ledger_name FROM descriptions WHERE description = ?", (security_desc,)
+        ).fetchone()
+        name = row[0] if row is not None else self.add(security_desc)
+        self.names[security_desc] = name
+        return name
+
+    def add(self, security_desc):
+        """Records a description that is not in the index yet and returns its ledger name."""
+        name = ledger_name_from_desc(security_desc)
+        isin = find_isin(security_desc)
+        with self.connection:
+            if isin is not None:
+                # A description that is only the ISIN has no name of its own to give the security
+                if find_isin(security_desc.split('-')[0]) != isin:
+                    self.connection.execute("INSERT OR IGNORE INTO isins (isin, ledger_name) VALUES (?, ?)",
+                                            (isin, name))
+                row = self.connection.execute("SELECT ledger_name FROM isins WHERE isin = ?", (isin,)).fetchone()
+                if row is not None:
+                    name = row[0]
+            self.connection.execute("INSERT INTO descriptions (description, isin, ledger_name) VALUES (?, ?, ?)",
+                                    (security_desc, isin, name))
+        return name
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(DISTINCT ledger_name) FROM descriptions").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from constants import TRADE_DATE_FORMAT
+
+UNKNOWN_TRADE_DATE = "unknown"
+SPECULATION_COLUMNS = ["Trade Date", "Security", "Bought", "Sold"]
+
+
+def parse_trade_date(trade_date):
+    """Parses a 'DD-MMM-YYYY' trade date, returning None when it is missing or invalid."""
+    try:
+        return datetime.strptime(trade_date, TRADE_DATE_FORMAT).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def trade_date_sort_key(trade_date):
+    # Notes without a readable trade date are reported last
+    return trade_date is None, trade_date or datetime.min.date()
+
+
+class SpeculationTracker:
+    """
+    Running bought and sold quantities per trade date and security, collected while the ledgers are built.
+
+    A security that was both bought and sold on the same trade date is an intraday (speculative) trade. Totals
+    are kept across every note added, so several notes for the same day, or a batch spanning many days, are
+    reported in one pass without re-reading the extracted tables.
+    """
+
+    def __init__(self):
+        self.totals = {}
+
+    def add_trades(self, trade_date, trades):
+        """
+        Adds the quantities of a note's trades to the running totals of its trade date.
+
+        Parameters:
+            trade_date (str): Trade date of the note in the format 'DD-MMM-YYYY'.
+            trades (list): TradeRow objects of the note.
+        """
+        day_totals = self.totals.setdefault(parse_trade_date(trade_date), {})
+        for trade in trades:
+            security = trade.security_name
+            if not security:
+                continue
+            quantities = day_totals.setdefault(security, [0, 0])
+            quantities[0] += trade.quantity_bought
+            quantities[1] += trade.quantity_sold
+
+    def speculation(self):
+        """
+        Returns:
+            dict: {trade_date: {security: (bought_qty, sold_qty)}} for every security both bought and sold on a
+            trade date, ordered by trade date and security.
+        """
+        speculation = {}
+        for trade_date in sorted(self.totals, key=trade_date_sort_key):
+            securities = {security: tuple(qty) for security, qty in sorted(self.totals[trade_date].items())
+                          if qty[0] > 0 and qty[1] > 0}
+            if securities:
+                speculation[trade_date] = securities
+        return speculation
+
+    def as_frame(self):
+        """Returns the per-security totals as a DataFrame indexed by trade date."""
+        import pandas as pd
+
+        rows = [[trade_date, security, bought_qty, sold_qty]
+                for trade_date in sorted(self.totals, key=trade_date_sort_key)
+                for security, (bought_qty, sold_qty) in sorted(self.totals[trade_date].items())]
+        return pd.DataFrame(rows, columns=SPECULATION_COLUMNS).set_index(SPECULATION_COLUMNS[0])
+
+    def print_report(self):
+        """Prints the speculative trades of every trade date seen so far."""
+        print("Identifying speculative trades")
+        speculation = self.speculation()
+        if not speculation:
+            print("No speculative trades found.")
+            return
+
+        for trade_date, securities in speculation.items():
+            if len(self.totals) > 1:
+                label = trade_date.strftime(TRADE_DATE_FORMAT) if trade_date else UNKNOWN_TRADE_DATE
+                print(f"Trade date {label}:")
+            for stock, (bought_qty, sold_qty) in securities.items():
+                print(f"Speculation detected for stock:\n {stock} | Bought: {bought_qty} | Sold: {sold_qty}")
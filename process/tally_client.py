@@ -0,0 +1,346 @@
+import http.client
+import queue
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from constants import (
+    CSV_ENCODING, TALLY_URL, TALLY_BATCH_SIZE, TALLY_CONNECTIONS, TALLY_RETRIES, TALLY_RETRY_BACKOFF, TALLY_TIMEOUT,
+    REPORT_NAME_ALL_MASTERS, XML_TALLYMESSAGE, XML_REQUESTNAME,
+)
+from process.tally_xml import envelope_start, envelope_end, iter_ledger_messages
+
+# Counters Tally reports for an import, in the order they are printed
+RESPONSE_COUNTERS = ["CREATED", "ALTERED", "DELETED", "COMBINED", "IGNORED", "CANCELLED", "ERRORS", "EXCEPTIONS"]
+# Counters printed even when zero; the others only when Tally reported some
+REPORTED_COUNTERS = ["CREATED", "ALTERED", "ERRORS"]
+COUNTER_REGEXES = {name: re.compile(rf"<{name}>\s*(-?\d+)\s*</{name}>") for name in RESPONSE_COUNTERS}
+LINE_ERROR_REGEX = re.compile(r"<LINEERROR>(.*?)</LINEERROR>", re.S)
+REPORT_NAME_REGEX = re.compile(rf"<{XML_REQUESTNAME}>(.*?)</{XML_REQUESTNAME}>", re.S)
+
+MESSAGE_START = f"<{XML_TALLYMESSAGE}"
+MESSAGE_END = f"</{XML_TALLYMESSAGE}>"
+FILE_CHUNK_SIZE = 1024 * 1024
+
+# HTTP status of a server that turned the request away without processing it
+HTTP_SERVICE_UNAVAILABLE = 503
+
+
+class TallyImportError(Exception):
+    """A batch got no usable import response from Tally."""
+
+
+class UnansweredBatchError(TallyImportError):
+    """A batch was sent in full but no response came back, so Tally may or may not have imported it."""
+
+
+def parse_import_response(body):
+    """
+    Reads the counters and line errors from Tally's response to an import request.
+
+    Both the bare <RESPONSE> of older releases and the <ENVELOPE> wrapped <IMPORTRESULT> of newer ones are read.
+
+    Returns:
+        tuple: ({counter: value} for the counters present, [line error messages]), or None if the body is not an
+            import response.
+    """
+    counts = {}
+    for name, regex in COUNTER_REGEXES.items():
+        match = regex.search(body)
+        if match:
+            counts[name] = int(match.group(1))
+    if not counts:
+        return None
+    return counts, [error.strip() for error in LINE_ERROR_REGEX.findall(body)]
+
+
+class ImportResult:
+    """Totals of the import responses of every batch, and the batches that never got one."""
+
+    def __init__(self):
+        self.counts = {name: 0 for name in RESPONSE_COUNTERS}
+        self.line_errors = []
+        self.batches = 0
+        self.messages = 0
+        self.failed_batches = 0
+        self.failed_messages = 0
+        self.unanswered_batches = 0
+        self.unanswered_messages = 0
+
+    def add_response(self, num_messages, counts, line_errors):
+        self.batches += 1
+        self.messages += num_messages
+        for name, value in counts.items():
+            self.counts[name] += value
+        self.line_errors.extend(line_errors)
+
+    def add_failure(self, num_messages, unanswered=False):
+        self.batches += 1
+        self.messages += num_messages
+        if unanswered:
+            self.unanswered_batches += 1
+            self.unanswered_messages += num_messages
+        else:
+            self.failed_batches += 1
+            self.failed_messages += num_messages
+
+    def print_report(self, seconds=None):
+        timing = f" in {seconds:.2f}s" if seconds is not None else ""
+        print(f"Posted {self.messages} messages in {self.batches} batches{timing}")
+        shown = [name for name in RESPONSE_COUNTERS if self.counts[name] or name in REPORTED_COUNTERS]
+        print(", ".join(f"{name.lower()}: {self.counts[name]}" for name in shown))
+        for error in self.line_errors:
+            print(f"Tally error: {error}")
+        if self.failed_batches:
+            print(f"{self.failed_batches} batches ({self.failed_messages} messages) were not imported")
+        if self.unanswered_batches:
+            print(f"{self.unanswered_batches} batches ({self.unanswered_messages} messages) were sent but got no "
+                  "response; check Tally before posting them again, as they may have been imported")
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP connections to one server, each used by one request at a time.
+
+    Connections are opened on first use and reused for every later request, so a batch only pays for the TCP
+    handshake when the server has closed its connection.
+
+    Parameters:
+        host (str): Server host name.
+        port (int): Server port.
+        size (int): Maximum number of connections.
+        timeout (float): Socket timeout in seconds.
+    """
+
+    def __init__(self, host, port, size, timeout):
+        self.idle = queue.LifoQueue()
+        for _ in range(size):
+            self.idle.put(http.client.HTTPConnection(host, port, timeout=timeout))
+
+    @contextmanager
+    def connection(self):
+        """Lends a connection for one request. A connection that fails is closed, and reconnects on its next use."""
+        connection = self.idle.get()
+        try:
+            yield connection
+        except BaseException:
+            connection.close()
+            raise
+        finally:
+            self.idle.put(connection)
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+class TallyClient:
+    """
+    Posts TALLYMESSAGE batches to Tally's XML-over-HTTP port.
+
+    Up to `connections` batches are in flight at once, each on its own keep-alive connection from a pool.
+
+    Only a batch Tally cannot have imported is posted again, up to `retries` times with exponential backoff: one
+    that failed before it was sent in full (e.g. the connection was refused) or was turned away with HTTP 503.
+    A batch that was sent but timed out or lost its connection before the response may already be imported, and
+    posting it again would duplicate vouchers, so it is reported as unanswered unless retry_unanswered is set.
+    A batch Tally answered is never posted again, even if its response reports errors.
+
+    Parameters:
+        url (str): Address of the Tally server, e.g. 'http://localhost:9000'.
+        connections (int): Number of batches posted concurrently.
+        retries (int): Attempts after the first for a batch that got no import response.
+        backoff (float): Seconds before the first retry, doubled for every further retry.
+        timeout (float): Seconds to wait for Tally to answer one batch.
+        retry_unanswered (bool): Also retry batches that were sent but got no response. Only safe for imports that
+            can be repeated, such as creating masters.
+    """
+
+    def __init__(self, url=TALLY_URL, connections=TALLY_CONNECTIONS, retries=TALLY_RETRIES,
+                 backoff=TALLY_RETRY_BACKOFF, timeout=TALLY_TIMEOUT, retry_unanswered=False):
+        parts = urlsplit(url)
+        if parts.scheme != "http" or not parts.hostname:
+            raise ValueError(f"Tally URL must be of the form http://host:port, got {url}")
+
+        self.path = parts.path or "/"
+        self.connections = max(connections, 1)
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_unanswered = retry_unanswered
+        self.pool = ConnectionPool(parts.hostname, parts.port or 80, self.connections, timeout)
+
+    def post(self, xml):
+        """
+        Posts one import request and returns Tally's parsed response.
+
+        Raises:
+            UnansweredBatchError: If the request was sent but no response came back (see retry_unanswered).
+            TallyImportError: If Tally answered without an import response, or every attempt failed before the
+                request was sent or was turned away.
+        """
+        body = xml.encode(CSV_ENCODING)
+        headers = {"Content-Type": f"text/xml; charset={CSV_ENCODING}", "Content-Length": str(len(body))}
+        attempt = 0
+        while True:
+            reused = False
+            sent = False
+            try:
+                with self.pool.connection() as connection:
+                    reused = connection.sock is not None
+                    connection.request("POST", self.path, body, headers)
+                    sent = True
+                    response = connection.getresponse()
+                    text = response.read().decode(CSV_ENCODING, errors="replace")
+            except (OSError, http.client.HTTPException) as e:
+                # A reused connection that fails while sending, or closes without a single byte of response, was
+                # dropped by the server while idle, before the request arrived; reconnect at once without using up
+                # a retry
+                if reused and (not sent or isinstance(e, http.client.RemoteDisconnected)):
+                    continue
+                error = e
+            else:
+                if response.status != HTTP_SERVICE_UNAVAILABLE:
+                    parsed = parse_import_response(text)
+                    if parsed is None:
+                        raise TallyImportError(f"HTTP {response.status} {response.reason}: no import counts in "
+                                               "the response")
+                    return parsed
+                error = f"HTTP {response.status} {response.reason}"
+                sent = False
+
+            if sent and not self.retry_unanswered:
+                raise UnansweredBatchError(f"Sent but got no response, so it may have been imported: {error}")
+            if attempt >= self.retries:
+                raise TallyImportError(f"No import response after {attempt + 1} attempts: {error}")
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def post_batch(self, messages, report_name=REPORT_NAME_ALL_MASTERS):
+        """Posts a list of TALLYMESSAGE elements in one import envelope and returns the parsed response."""
+        return self.post(envelope_start(report_name) + "".join(messages) + envelope_end())
+
+    def import_messages(self, messages, batch_size=TALLY_BATCH_SIZE, report_name=REPORT_NAME_ALL_MASTERS):
+        """
+        Imports TALLYMESSAGE elements into Tally in batches of batch_size.
+
+        The first batch is imported on its own, so the groups and masters at the start of the stream exist before
+        any later batch refers to them. The rest are posted concurrently. Messages are read from the iterable
+        only as batches are sent, and at most two batches per connection are held at once.
+
+        Parameters:
+            messages (iterable): TALLYMESSAGE XML strings, in import order.
+            batch_size (int): Number of messages per request.
+            report_name (str): REPORTNAME of the import, e.g. 'All Masters' or 'Vouchers'.
+
+        Returns:
+            ImportResult: Counters summed over every batch.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        result = ImportResult()
+        batches = iter_batches(messages, batch_size)
+        first = next(batches, None)
+        if first is None:
+            return result
+        self.record(result, first, lambda: self.post_batch(first, report_name))
+
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            for batch in batches:
+                if len(in_flight) >= 2 * self.connections:
+                    self.record(result, *in_flight.popleft())
+                future = executor.submit(self.post_batch, batch, report_name)
+                in_flight.append((batch, future.result))
+            while in_flight:
+                self.record(result, *in_flight.popleft())
+        return result
+
+    @staticmethod
+    def record(result, batch, get_response):
+        try:
+            counts, line_errors = get_response()
+        except TallyImportError as e:
+            print(f"Failed to import a batch of {len(batch)} messages: {e}")
+            result.add_failure(len(batch), isinstance(e, UnansweredBatchError))
+        else:
+            result.add_response(len(batch), counts, line_errors)
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_batches(messages, batch_size):
+    """Yields lists of up to batch_size messages."""
+    batch = []
+    for message in messages:
+        batch.append(message)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_report_name(xml_path):
+    """Returns the REPORTNAME of an import file, read from its beginning, or 'All Masters' if it has none."""
+    with open(xml_path, encoding=CSV_ENCODING) as xml_file:
+        match = REPORT_NAME_REGEX.search(xml_file.read(FILE_CHUNK_SIZE))
+    return match.group(1).strip() if match else REPORT_NAME_ALL_MASTERS
+
+
+def iter_file_messages(xml_path):
+    """
+    Yields the TALLYMESSAGE elements of an import file one at a time, e.g. to post an existing large file in batches.
+
+    The file is read in chunks, so memory use does not grow with its size.
+    """
+    buffer = ""
+    with open(xml_path, encoding=CSV_ENCODING) as xml_file:
+        for chunk in iter(lambda: xml_file.read(FILE_CHUNK_SIZE), ""):
+            buffer += chunk
+            while True:
+                start = buffer.find(MESSAGE_START)
+                if start < 0:
+                    # Keep a tail in case the next chunk completes a start tag cut in two
+                    buffer = buffer[-len(MESSAGE_START):]
+                    break
+                end = buffer.find(MESSAGE_END, start)
+                if end < 0:
+                    buffer = buffer[start:]
+                    break
+                end += len(MESSAGE_END)
+                yield buffer[start:end] + "\n"
+                buffer = buffer[end:]
+
+
+def import_to_tally(messages, report_name=REPORT_NAME_ALL_MASTERS, url=TALLY_URL, batch_size=TALLY_BATCH_SIZE,
+                    connections=TALLY_CONNECTIONS, retries=TALLY_RETRIES, retry_unanswered=False):
+    """
+    Imports TALLYMESSAGE elements into the Tally server at url and prints the totals of its responses.
+
+    Returns:
+        ImportResult: Counters summed over every batch.
+    """
+    start = time.perf_counter()
+    with TallyClient(url, connections, retries, retry_unanswered=retry_unanswered) as client:
+        result = client.import_messages(messages, batch_size, report_name)
+    result.print_report(time.perf_counter() - start)
+    return result
+
+
+def import_ledger_csv(csv_path, **kwargs):
+    """Creates the group and the ledgers of a ledger CSV in Tally. Keyword arguments go to import_to_tally."""
+    return import_to_tally(iter_ledger_messages(csv_path), REPORT_NAME_ALL_MASTERS, **kwargs)
+
+
+def import_xml_file(xml_path, **kwargs):
+    """Posts the messages of an existing import file in batches. Keyword arguments go to import_to_tally."""
+    return import_to_tally(iter_file_messages(xml_path), read_report_name(xml_path), **kwargs)
@@ -0,0 +1,131 @@
+import csv
+
+from constants import (
+    CSV_ENCODING, XML_INDENT,
+
+    XML_ENVELOPE, XML_HEADER, XML_TALLYREQUEST, XML_BODY, XML_IMPORT_DATA, XML_REQUESTDESC,
+    XML_REQUESTNAME, REPORT_NAME_ALL_MASTERS, XML_REQUESTDATA, XML_TALLYMESSAGE, TALLY_UDF_NAMESPACE,
+    TALLY_GROUP_NAME, XML_ACTION, XML_ACTION_CREATE, XML_GROUP, XML_NAME, XML_PARENT, TALLY_GROUP_PARENT,
+    CSV_COLUMN_DR_LEDGER, XML_LEDGER, XML_OPENINGBALANCE, CSV_COLUMN_AMOUNT, CSV_COLUMN_NARRATION, XML_NARRATION,
+)
+from process.security_master import normalize_ledger_name
+
+XML_DECLARATION = '<?xml version="1.0" ?>\n'
+
+
+def escape_xml(value):
+    """
+    Escapes &, <, > and double quotes in text and attribute values.
+
+    Same result as xml.sax.saxutils.escape with a quote entity, without importing it (it pulls in urllib).
+    """
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+
+def start_tag(tag, depth, attributes=None):
+    attrs = "".join(f' {name}="{escape_xml(value)}"' for name, value in (attributes or {}).items())
+    return f"{XML_INDENT * depth}<{tag}{attrs}>\n"
+
+
+def end_tag(tag, depth):
+    return f"{XML_INDENT * depth}</{tag}>\n"
+
+
+def text_element(tag, text, depth):
+    if not text:
+        return f"{XML_INDENT * depth}<{tag}/>\n"
+    return f"{XML_INDENT * depth}<{tag}>{escape_xml(text)}</{tag}>\n"
+
+
+def group_message(depth):
+    """Returns the TALLYMESSAGE that creates the TALLY_GROUP_NAME group."""
+    return (
+        start_tag(XML_TALLYMESSAGE, depth, {"xmlns:UDF": TALLY_UDF_NAMESPACE})
+        + start_tag(XML_GROUP, depth + 1, {"NAME": TALLY_GROUP_NAME, XML_ACTION: XML_ACTION_CREATE})
+        + text_element(XML_NAME, TALLY_GROUP_NAME, depth + 2)
+        + text_element(XML_PARENT, TALLY_GROUP_PARENT, depth + 2)
+        + end_tag(XML_GROUP, depth + 1)
+        + end_tag(XML_TALLYMESSAGE, depth)
+    )
+
+
+def ledger_message(name, opening_balance, narration, depth):
+    """Returns the TALLYMESSAGE that creates one ledger under TALLY_GROUP_NAME."""
+    return (
+        start_tag(XML_TALLYMESSAGE, depth, {"xmlns:UDF": TALLY_UDF_NAMESPACE})
+        + start_tag(XML_LEDGER, depth + 1, {"NAME": name, XML_ACTION: XML_ACTION_CREATE})
+        + text_element(XML_NAME, name, depth + 2)
+        + text_element(XML_PARENT, TALLY_GROUP_NAME, depth + 2)
+        + text_element(XML_OPENINGBALANCE, opening_balance, depth + 2)
+        + text_element(XML_NARRATION, narration, depth + 2)
+        + end_tag(XML_LEDGER, depth + 1)
+        + end_tag(XML_TALLYMESSAGE, depth)
+    )
+
+
+def iter_ledger_rows(csv_path):
+    """
+    Yields (ledger name, amount, narration) for every row of a ledger CSV, one row at a time.
+
+    Values are read as the text stored in the CSV, so amounts are written exactly as they appear in the ledger.
+    The csv module is used rather than pandas so regenerating the XML does not pay for importing pandas.
+    """
+    with open(csv_path, newline="", encoding=CSV_ENCODING) as csv_file:
+        for row in csv.DictReader(csv_file):
+            yield normalize_ledger_name(row[CSV_COLUMN_DR_LEDGER]), row[CSV_COLUMN_AMOUNT], row[CSV_COLUMN_NARRATION]
+
+
+def envelope_start(report_name=REPORT_NAME_ALL_MASTERS):
+    """Returns the XML of an import envelope up to and including the opening REQUESTDATA tag."""
+    return (
+        XML_DECLARATION
+        + start_tag(XML_ENVELOPE, 0)
+        + start_tag(XML_HEADER, 1)
+        + text_element(XML_TALLYREQUEST, "Import Data", 2)
+        + end_tag(XML_HEADER, 1)
+        + start_tag(XML_BODY, 1)
+        + start_tag(XML_IMPORT_DATA, 2)
+        + start_tag(XML_REQUESTDESC, 3)
+        + text_element(XML_REQUESTNAME, report_name, 4)
+        + end_tag(XML_REQUESTDESC, 3)
+        + start_tag(XML_REQUESTDATA, 3)
+    )
+
+
+def envelope_end():
+    """Returns the XML closing an envelope opened by envelope_start."""
+    return end_tag(XML_REQUESTDATA, 3) + end_tag(XML_IMPORT_DATA, 2) + end_tag(XML_BODY, 1) + end_tag(XML_ENVELOPE, 0)
+
+
+def iter_ledger_messages(csv_path):
+    """
+    Yields the TALLYMESSAGE creating the TALLY_GROUP_NAME group, then one creating each ledger of a ledger CSV.
+
+    A ledger is created once, from the first row that posts to it; only the set of names already yielded is kept
+    in memory.
+    """
+    yield group_message(4)
+
+    written = set()
+    for dr_ledger, amount, narration in iter_ledger_rows(csv_path):
+        if dr_ledger not in written:
+            written.add(dr_ledger)
+            yield ledger_message(dr_ledger, amount, narration, 4)
+
+
+def write_ledger_xml(csv_path, xml_path):
+    """
+    Streams a Tally "All Masters" import file for the ledgers in a ledger CSV.
+
+    The CSV is read row by row and each LEDGER message is written straight to xml_path. The layout matches the
+    pretty-printed output of minidom.
+
+    Parameters:
+        csv_path (str): Path to the ledger CSV.
+        xml_path (str): Path of the XML file to write.
+    """
+    with open(xml_path, "w", encoding=CSV_ENCODING) as xml_file:
+        xml_file.write(envelope_start())
+        for message in iter_ledger_messages(csv_path):
+            xml_file.write(message)
+        xml_file.write(envelope_end())
@@ -0,0 +1,144 @@
+import math
+import re
+
+from constants import (
+    PARENTHESES_PATTERN, SEGMENT_COLUMN, BROKER_NAME,
+    COLUMN_SECURITY_DESC, COLUMN_QUANTITY_BOUGHT, COLUMN_QUANTITY_SOLD, COLUMN_TOTAL_GROSS, COLUMN_AVERAGE_RATE,
+    COLUMN_BROKERAGE, COLUMN_GST, COLUMN_STT, COLUMN_OTHER_LEVIES, COLUMN_NET_AMOUNT,
+)
+from process.security_master import ledger_name_from_desc
+
+INTEGER_PATTERN = re.compile(r"[+-]?\d+")
+PARENTHESES_REGEX = re.compile(PARENTHESES_PATTERN)
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+REQUIRED_COLUMNS = [COLUMN_SECURITY_DESC, COLUMN_QUANTITY_BOUGHT, COLUMN_QUANTITY_SOLD, COLUMN_TOTAL_GROSS,
+                    COLUMN_AVERAGE_RATE]
+NUMERIC_COLUMNS = [COLUMN_QUANTITY_BOUGHT, COLUMN_QUANTITY_SOLD, COLUMN_TOTAL_GROSS, COLUMN_AVERAGE_RATE,
+                   COLUMN_BROKERAGE, COLUMN_GST, COLUMN_STT, COLUMN_OTHER_LEVIES, COLUMN_NET_AMOUNT]
+
+
+class TradeRow:
+    """
+    One row of a contract note's trade table, with its quantities and amounts already parsed as numbers.
+
+    Numeric fields keep the type their whole column had in the source table: int when every cell of the column
+    was an integer, float otherwise. This matches how the ledger narrations and amounts have always been rendered.
+
+    broker is the Tally ledger of the broker that issued the contract note.
+    """
+
+    __slots__ = ("segment", "security_desc", "quantity_bought", "quantity_sold", "total_gross", "average_rate",
+                 "brokerage", "gst", "stt", "other_levies", "net_amount", "broker")
+
+    def __init__(self, segment, security_desc, quantity_bought, quantity_sold, total_gross, average_rate,
+                 brokerage=0, gst=0, stt=0, other_levies=0, net_amount=0, broker=BROKER_NAME):
+        self.segment = segment
+        self.security_desc = security_desc
+        self.quantity_bought = quantity_bought
+        self.quantity_sold = quantity_sold
+        self.total_gross = total_gross
+        self.average_rate = average_rate
+        self.brokerage = brokerage
+        self.gst = gst
+        self.stt = stt
+        self.other_levies = other_levies
+        self.net_amount = net_amount
+        self.broker = broker
+
+    @property
+    def ledger_name(self):
+        """
+        Tally ledger name of the security, e.g. 'NHPC LIMITED SHARES'.
+
+        Built from the description alone; SecurityMaster.ledger_name also maps ISINs to the ledger already in use.
+        """
+        return ledger_name_from_desc(self.security_desc)
+
+    @property
+    def security_name(self):
+        """Security description with line breaks from the PDF cell removed."""
+        return self.security_desc.replace('\n', ' ').strip()
+
+    def as_list(self):
+        return [getattr(self, field) for field in self.__slots__]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+    def __eq__(self, other):
+        return isinstance(other, TradeRow) and self.as_list() == other.as_list()
+
+    def __repr__(self):
+        return f"TradeRow({', '.join(repr(value) for value in self.as_list())})"
+
+
+def clean_cell(cell):
+    """Strips a cell and removes parentheses around numbers, e.g. '(12.50)' -> '12.50'."""
+    if not isinstance(cell, str):
+        return cell
+    return PARENTHESES_REGEX.sub(r'\1', cell).strip()
+
+
+def parse_float(cell):
+    """Parses a cell as a float, treating blank or invalid values as 0."""
+    try:
+        value = float(cell)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(value) else value
+
+
+def parse_number_column(cells):
+    """Parses a table column as ints if every cell is an integer, and as floats (invalid cells as 0) otherwise."""
+    if all(isinstance(cell, str) and INTEGER_PATTERN.fullmatch(cell) for cell in cells):
+        return [int(cell) for cell in cells]
+    return [parse_float(cell) for cell in cells]
+
+
+def normalize_header(cell):
+    return WHITESPACE_REGEX.sub(' ', (cell or '').strip())
+
+
+def parse_trade_table(table, column_map=None, broker=BROKER_NAME):
+    """
+    Converts a filtered table (header row first) into TradeRow objects.
+
+    Cells are cleaned and numbers parsed once here, so later stages work with typed values directly.
+
+    Parameters:
+        table (list): A trade table as extracted by pdfplumber, header row first.
+        column_map (dict): Optional broker header labels mapped to the COLUMN_* names used here.
+        broker (str): Tally ledger of the broker that issued the note.
+
+    Returns:
+        list: The TradeRow for every row after the header.
+
+    Raises:
+        ValueError: If the header lacks one of the columns the ledgers need.
+    """
+    column_map = column_map or {}
+    header = [normalize_header(cell) for cell in table[0]]
+    header = [column_map.get(cell, cell) for cell in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Trade table is missing columns: {', '.join(missing)}")
+
+    rows = [[clean_cell(cell) for cell in row] for row in table[1:]]
+
+    def column(name):
+        if name not in header:
+            return [0] * len(rows)
+        idx = header.index(name)
+        return [row[idx] for row in rows]
+
+    numbers = {name: parse_number_column(column(name)) for name in NUMERIC_COLUMNS}
+    segments = column(SEGMENT_COLUMN) if SEGMENT_COLUMN in header else [''] * len(rows)
+    descriptions = column(COLUMN_SECURITY_DESC)
+
+    return [
+        TradeRow(segments[idx] or '', descriptions[idx] or '', *(numbers[name][idx] for name in NUMERIC_COLUMNS),
+                 broker=broker)
+        for idx in range(len(rows))
+    ]
@@ -0,0 +1,100 @@
+import os
+import time
+from contextlib import nullcontext
+
+from constants import PDF_EXT, WATCH_POLL_INTERVAL
+from process.process_pdf import process_notes
+
+# A complete PDF ends with an end-of-file marker, normally within its last few bytes
+PDF_EOF_MARKER = b"%%EOF"
+PDF_EOF_TAIL_BYTES = 1024
+
+
+def has_pdf_eof(file_path):
+    """Returns True if the file ends with a PDF end-of-file marker, i.e. it is not still being written."""
+    try:
+        with open(file_path, "rb") as pdf:
+            pdf.seek(0, os.SEEK_END)
+            pdf.seek(max(pdf.tell() - PDF_EOF_TAIL_BYTES, 0))
+            return PDF_EOF_MARKER in pdf.read()
+    except OSError:
+        return False
+
+
+def scan_notes(folder_path):
+    """Returns {file_path: (size, mtime_ns)} for the PDF files in a folder."""
+    notes = {}
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(PDF_EXT) and entry.is_file():
+                stat = entry.stat()
+                notes[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return notes
+
+
+class FolderWatcher:
+    """
+    Polls a folder for contract notes and reports the ones that have finished being written.
+
+    A note is ready once its size and modification time are unchanged between two polls and it ends with the
+    PDF end-of-file marker. Notes that were handed out but left in the folder (e.g. they failed to unlock) are
+    only handed out again after they change.
+
+    Parameters:
+        folder_path (str): Folder to watch.
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self.last_seen = {}
+        self.handled = {}
+
+    def ready_notes(self):
+        """Returns the paths of notes that are ready to process, in sorted order."""
+        current = scan_notes(self.folder_path)
+        ready = [file_path for file_path, state in current.items()
+                 if self.last_seen.get(file_path) == state and self.handled.get(file_path) != state
+                 and state[0] > 0 and has_pdf_eof(file_path)]
+
+        self.last_seen = current
+        self.handled = {file_path: state for file_path, state in self.handled.items() if file_path in current}
+        for file_path in ready:
+            self.handled[file_path] = current[file_path]
+        return sorted(ready)
+
+
+def watch_folder(folder_path, completed_folder, passwd, workers=1, cache=None, manifest=None, metrics_path=None,
+                 ledger_store=None, pnl_book=None, security_master=None,
+                 poll_interval=WATCH_POLL_INTERVAL):
+    """
+    Runs as a service, processing every contract note that arrives in a folder until interrupted.
+
+    The imported modules, the extraction cache, the manifest, the P&L book, the security master and (with
+    workers > 1) the process pool stay open between notes, so each note only pays for its own extraction and
+    ledger writes.
+
+    Parameters:
+        folder_path (str): Folder to watch for contract notes.
+        poll_interval (float): Seconds between scans of the folder.
+
+    The remaining parameters are passed to process_notes.
+    """
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+    watcher = FolderWatcher(folder_path)
+    print(f"Watching {folder_path} for contract notes. Press Ctrl+C to stop.")
+    try:
+        with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+            while True:
+                ready = watcher.ready_notes()
+                if ready:
+                    process_notes(ready, completed_folder, passwd, workers, cache, manifest, metrics_path,
+                                  ledger_store, pnl_book, security_master, executor)
+                else:
+                    time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
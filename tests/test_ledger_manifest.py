@@ -0,0 +1,205 @@
+"""
+Regression tests for the ledger manifest: full runs followed by incremental runs, duplicate notes and notes whose
+content changed, including the byte-range editing of LedgerManifest.remove_note.
+
+Usage:
+    python -m unittest tests.test_ledger_manifest
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+
+from benchmarks.synthetic_notes import make_contract_note
+from constants import (
+    BUY_LEDGER_CSV, COMPLETED_FOLDER_PATH, CSV_ENCODING, CSV_FOLDER_PATH, DOCS_FOLDER_PATH, LEDGER_FOLDER_PATH,
+    LEDGER_MANIFEST_JSON, SELL_LEDGER_CSV,
+)
+from process.ledger_manifest import LedgerManifest
+from process.ledger_store import LedgerStore
+from process.pipeline import run_pipeline
+
+PASSWORD = "TEST01"
+
+
+def read_bytes(path):
+    with open(path, "rb") as ledger_file:
+        return ledger_file.read()
+
+
+def ledger_rows(path):
+    """Returns the data rows of a ledger CSV as a multiset, as a replaced note's rows move to the end."""
+    with open(path, encoding=CSV_ENCODING) as ledger_file:
+        return Counter(ledger_file.read().splitlines()[1:])
+
+
+class WorkFolderTestCase(unittest.TestCase):
+    """Runs each test in an empty folder, as every output path in constants is relative to it."""
+
+    def setUp(self):
+        self.previous_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+
+    def tearDown(self):
+        os.chdir(self.previous_dir)
+        shutil.rmtree(self.work_dir)
+
+
+class LedgerManifestTest(WorkFolderTestCase):
+
+    def append_note(self, manifest, filename, buy_lines, sell_lines):
+        """Appends rows for a note the way write_note does and records them in the manifest."""
+        start_offsets = manifest.ledger_sizes()
+        for side, lines in (("buy", buy_lines), ("sell", sell_lines)):
+            if not lines:
+                continue
+            with open(manifest.ledgers[side], "ab") as ledger_file:
+                if start_offsets[side] == 0:
+                    ledger_file.write(b"Date,Amount\n")
+                ledger_file.write(b"".join(line + b"\n" for line in lines))
+        manifest.record_note(filename, f"hash-{filename}", "01-Apr-2024", len(buy_lines), len(sell_lines),
+                             start_offsets)
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(CSV_FOLDER_PATH)
+        self.manifest = LedgerManifest(LEDGER_MANIFEST_JSON, BUY_LEDGER_CSV, SELL_LEDGER_CSV)
+        self.append_note(self.manifest, "a.pdf", [b"a,1", b"a,2"], [b"a,3"])
+        self.append_note(self.manifest, "b.pdf", [b"b,1"], [])
+        self.append_note(self.manifest, "c.pdf", [b"c,1", b"c,2"], [b"c,3"])
+
+    def test_remove_middle_note_shifts_later_offsets(self):
+        self.manifest.remove_note("b.pdf")
+        self.assertEqual(read_bytes(BUY_LEDGER_CSV), b"Date,Amount\na,1\na,2\nc,1\nc,2\n")
+        self.assertEqual(read_bytes(SELL_LEDGER_CSV), b"Date,Amount\na,3\nc,3\n")
+
+        self.manifest.remove_note("c.pdf")
+        self.assertEqual(read_bytes(BUY_LEDGER_CSV), b"Date,Amount\na,1\na,2\n")
+        self.assertEqual(read_bytes(SELL_LEDGER_CSV), b"Date,Amount\na,3\n")
+
+    def test_remove_first_note_keeps_header(self):
+        self.manifest.remove_note("a.pdf")
+        self.assertEqual(read_bytes(BUY_LEDGER_CSV), b"Date,Amount\nb,1\nc,1\nc,2\n")
+        self.assertEqual(read_bytes(SELL_LEDGER_CSV), b"Date,Amount\nc,3\n")
+
+        # Offsets shifted by the first removal must still be right for the next one
+        self.manifest.remove_note("c.pdf")
+        self.assertEqual(read_bytes(BUY_LEDGER_CSV), b"Date,Amount\nb,1\n")
+        self.assertEqual(read_bytes(SELL_LEDGER_CSV), b"Date,Amount\n")
+
+    def test_manifest_is_saved_and_reloaded(self):
+        self.manifest.remove_note("b.pdf")
+        reloaded = LedgerManifest(LEDGER_MANIFEST_JSON, BUY_LEDGER_CSV, SELL_LEDGER_CSV)
+        self.assertEqual(reloaded.notes, self.manifest.notes)
+        self.assertTrue(reloaded.is_duplicate("hash-c.pdf"))
+        self.assertFalse(reloaded.is_duplicate("hash-b.pdf"))
+
+
+class IncrementalRunTest(WorkFolderTestCase):
+    """Drives run_pipeline over synthetic notes, full run first and incremental runs after it."""
+
+    def setUp(self):
+        super().setUp()
+        for folder in (DOCS_FOLDER_PATH, CSV_FOLDER_PATH, LEDGER_FOLDER_PATH):
+            os.makedirs(folder)
+        self.notes_dir = tempfile.mkdtemp(dir=self.work_dir)
+        self.note_a = self.make_note("note_a.pdf", "01-Apr-2024", seed=1)
+        self.note_b = self.make_note("note_b.pdf", "02-Apr-2024", seed=2)
+
+    def make_note(self, filename, trade_date, seed, folder=None):
+        path = os.path.join(folder or self.notes_dir, filename)
+        make_contract_note(path, PASSWORD, trade_date, trade_pages=1, filler_pages=0, rows_per_table=6,
+                           security_count=4, seed=seed)
+        return path
+
+    def deliver(self, *note_paths, filename=None):
+        """Copies notes into the docs folder, as a broker delivering them would."""
+        for note_path in note_paths:
+            shutil.copy(note_path, os.path.join(DOCS_FOLDER_PATH, filename or os.path.basename(note_path)))
+
+    def run_pipeline(self, incremental, no_parquet=True):
+        return run_pipeline(PASSWORD, no_cache=True, incremental=incremental, no_parquet=no_parquet)
+
+    def manifest_notes(self):
+        with open(LEDGER_MANIFEST_JSON, encoding=CSV_ENCODING) as manifest_file:
+            return json.load(manifest_file)["notes"]
+
+    def test_full_run_writes_manifest(self):
+        self.deliver(self.note_a, self.note_b)
+        self.assertTrue(self.run_pipeline(incremental=False))
+        self.assertEqual(sorted(self.manifest_notes()), ["note_a.pdf", "note_b.pdf"])
+
+    def test_incremental_after_full_run_appends_nothing(self):
+        self.deliver(self.note_a, self.note_b)
+        self.run_pipeline(incremental=False)
+        buy_ledger, sell_ledger = read_bytes(BUY_LEDGER_CSV), read_bytes(SELL_LEDGER_CSV)
+
+        self.deliver(self.note_a, self.note_b)
+        self.assertFalse(self.run_pipeline(incremental=True))
+        self.assertEqual(read_bytes(BUY_LEDGER_CSV), buy_ledger)
+        self.assertEqual(read_bytes(SELL_LEDGER_CSV), sell_ledger)
+        self.assertEqual(os.listdir(DOCS_FOLDER_PATH), [])
+
+    def test_duplicate_under_new_name_is_skipped(self):
+        self.deliver(self.note_a)
+        self.run_pipeline(incremental=False)
+        buy_ledger = read_bytes(BUY_LEDGER_CSV)
+
+        self.deliver(self.note_a, filename="note_a_copy.pdf")
+        self.assertFalse(self.run_pipeline(incremental=True))
+        self.assertEqual(read_bytes(BUY_LEDGER_CSV), buy_ledger)
+        self.assertNotIn("note_a_copy.pdf", self.manifest_notes())
+        self.assertIn("note_a_copy.pdf", os.listdir(COMPLETED_FOLDER_PATH))
+
+    def test_changed_note_replaces_only_its_rows(self):
+        self.deliver(self.note_a, self.note_b)
+        self.run_pipeline(incremental=False)
+
+        changed_dir = tempfile.mkdtemp(dir=self.work_dir)
+        changed_a = self.make_note("note_a.pdf", "01-Apr-2024", seed=3, folder=changed_dir)
+        self.deliver(changed_a)
+        self.assertTrue(self.run_pipeline(incremental=True))
+        incremental_buy, incremental_sell = ledger_rows(BUY_LEDGER_CSV), ledger_rows(SELL_LEDGER_CSV)
+        self.assertEqual(sorted(self.manifest_notes()), ["note_a.pdf", "note_b.pdf"])
+
+        # The same rows as a full run over the changed note, only in a different order
+        self.deliver(changed_a, self.note_b)
+        self.run_pipeline(incremental=False)
+        self.assertEqual(incremental_buy, ledger_rows(BUY_LEDGER_CSV))
+        self.assertEqual(incremental_sell, ledger_rows(SELL_LEDGER_CSV))
+
+    def test_failed_note_is_rolled_back_and_retried(self):
+        self.deliver(self.note_a)
+        self.run_pipeline(incremental=False, no_parquet=False)
+        buy_ledger, sell_ledger = read_bytes(BUY_LEDGER_CSV), read_bytes(SELL_LEDGER_CSV)
+
+        # The CSV rows of note_b are appended before its store write fails
+        self.deliver(self.note_b)
+        with mock.patch.object(LedgerStore, "write_note", side_effect=OSError("disk full")):
+            self.assertFalse(self.run_pipeline(incremental=True, no_parquet=False))
+        self.assertEqual(read_bytes(BUY_LEDGER_CSV), buy_ledger)
+        self.assertEqual(read_bytes(SELL_LEDGER_CSV), sell_ledger)
+        self.assertEqual(list(self.manifest_notes()), ["note_a.pdf"])
+        self.assertEqual(os.listdir(DOCS_FOLDER_PATH), ["note_b.pdf"])
+
+        self.assertTrue(self.run_pipeline(incremental=True, no_parquet=False))
+        self.assertEqual(sorted(self.manifest_notes()), ["note_a.pdf", "note_b.pdf"])
+        self.assertEqual(os.listdir(DOCS_FOLDER_PATH), [])
+
+    def test_incremental_refuses_ledgers_without_manifest(self):
+        self.deliver(self.note_a)
+        self.run_pipeline(incremental=False)
+        os.remove(LEDGER_MANIFEST_JSON)
+        buy_ledger = read_bytes(BUY_LEDGER_CSV)
+
+        self.deliver(self.note_b)
+        self.assertFalse(self.run_pipeline(incremental=True))
+        self.assertEqual(read_bytes(BUY_LEDGER_CSV), buy_ledger)
+
+
+if __name__ == "__main__":
+    unittest.main()